@@ -0,0 +1,91 @@
+# Amortization schedules for level-payment loans, matching PaymentLoan: the yearly rate is
+# split over the compounding periods and one payment is made every period
+from collections import namedtuple
+
+import numpy as np
+from calc_manager import compounding_methods
+
+SchedulePeriod = namedtuple("SchedulePeriod", "period payment interest principal balance")
+# principal, interest and balance are (loans x periods); loans past maturity are zero padded
+ScheduleBlock = namedtuple("ScheduleBlock", "first_loan payment interest principal balance")
+
+
+def _payments_per_year(compound):
+    m = compounding_methods[compound] if isinstance(compound, str) else compound
+    if isinstance(m, str) or np.any(np.asarray(m) <= 0):
+        raise ValueError(f"Schedules need a whole number of payments per year, not {compound!r}")
+    return m
+
+
+def level_payment(principal, rate, payments):
+    # Payment per period for rate per period over payments periods (rate 0 is straight-line)
+    principal, rate, payments = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                                      for a in (principal, rate, payments)))
+    if np.any(payments <= 0):
+        raise ValueError("A loan needs at least one payment")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + rate) ** payments
+        payment = rate * growth * principal / (growth - 1)
+        return np.where(rate == 0, principal / payments, payment)
+
+
+def amortization_schedule(principal, periods, rate, compound):
+    # Lazily yields a SchedulePeriod for each payment of one loan
+    m = _payments_per_year(compound)
+    r = rate / m
+    n = int(round(m * periods))
+    payment = float(level_payment(principal, r, n))
+    balance = float(principal)
+    for period in range(1, n + 1):
+        interest = balance * r
+        paid = balance if period == n else payment - interest
+        balance -= paid
+        yield SchedulePeriod(period, interest + paid, interest, paid, balance)
+
+
+def _balance_blocks(principals, periods, rates, compound, max_cells):
+    # Yields (first loan, rate per period, payment, balance) per chunk of loans, with balance
+    # (loans x periods + 1) starting at the principal and zero from maturity on
+    principals, periods, rates, m = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(a, dtype=float))
+          for a in (principals, periods, rates, _payments_per_year(compound))))
+    counts = np.rint(m * periods).astype(int)
+    width = max(int(counts.max(initial=0)), 1)
+    k = np.arange(width + 1)
+    chunk = max(1, max_cells // width)
+    for first in range(0, principals.size, chunk):
+        block = slice(first, first + chunk)
+        p, r, n = principals[block], (rates / m)[block], counts[block]
+        payment = level_payment(p, r, n)
+        # Closed-form balance after k payments, built in place: (1 + r)^k (p - pay/r) + pay/r
+        balance = np.power(1 + r[:, None], k)
+        level = r != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            perpetuity = np.where(level, payment / r, 0.0)
+        balance *= (p - perpetuity)[:, None]
+        balance += perpetuity[:, None]
+        if not level.all():
+            balance[~level] = p[~level, None] - payment[~level, None] * k
+        balance[k >= n[:, None]] = 0.0
+        yield first, r, payment, balance
+
+
+def amortization_schedules(principals, periods, rates, compound, max_cells=10_000_000):
+    # Yields a ScheduleBlock for each chunk of loans; a block holds at most max_cells entries
+    # per array, so pools of any size stream through bounded memory. compound is one method
+    # name or an array of payments per year.
+    for first, r, payment, balance in _balance_blocks(principals, periods, rates, compound,
+                                                      max_cells):
+        interest = balance[:, :-1] * r[:, None]
+        principal = balance[:, :-1] - balance[:, 1:]
+        yield ScheduleBlock(first, payment, interest, principal, balance[:, 1:])
+
+
+def pool_cashflows(principals, periods, rates, compound, max_cells=10_000_000):
+    # Total (interest, principal) the pool pays each period, without per-loan schedules
+    interest = principal = 0
+    for _, r, _, balance in _balance_blocks(principals, periods, rates, compound, max_cells):
+        interest = interest + r @ balance[:, :-1]
+        outstanding = balance.sum(axis=0)
+        principal = principal + outstanding[:-1] - outstanding[1:]
+    return interest, principal
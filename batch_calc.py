@@ -0,0 +1,368 @@
+import numpy as np
+import instrumentation
+from calc_manager import compounding_methods
+
+
+def _as_float_arrays(*arrays):
+    return np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in arrays))
+
+
+def bond_price_batch(face_value, coupons, coupons_per_period, yields, periods):
+    # Array version of BondPrice.calculate, same discrete / continuous (m > 10000) split
+    fv, coup, m, y, t = _as_float_arrays(face_value, coupons, coupons_per_period, yields,
+                                         periods)
+    price = np.empty(fv.shape)
+
+    discrete = m <= 10000
+    if discrete.any():
+        fv_d, coup_d, m_d, y_d = fv[discrete], coup[discrete], m[discrete], y[discrete]
+        discount = 1 / (1 + y_d / m_d) ** (m_d * t[discrete])
+        price[discrete] = fv_d * discount + (coup_d / y_d) * (1 - discount)
+
+    continuous = ~discrete
+    if continuous.any():
+        y_c, t_c = y[continuous], t[continuous]
+        growth = np.exp(y_c * t_c)
+        price[continuous] = (fv[continuous] + (coup[continuous] / y_c) * (growth - 1)) / growth
+
+    return price
+
+
+def _bond_discount_terms(m, t, y):
+    # Discount on the final payment and its first derivative in the yield
+    discrete = m <= 10000
+    base = np.where(discrete, 1 + y / m, 1.0)
+    discount = np.where(discrete, base ** -(m * t), np.exp(-y * t))
+    slope = -t * discount / base
+    return discount, slope
+
+
+def _bond_price_and_slope(fv, coup, m, t, y):
+    y = np.where(np.abs(y) < 1e-10, 1e-10, y)  # coupon annuity is 0/0 at a zero yield
+    discount, d_discount = _bond_discount_terms(m, t, y)
+    price = fv * discount + (coup / y) * (1 - discount)
+    slope = fv * d_discount - (coup / y ** 2) * (1 - discount) - (coup / y) * d_discount
+    return price, slope
+
+
+def _bond_price_terms(fv, coup, m, t, y):
+    # Price with its first and second derivatives in the yield
+    y = np.where(np.abs(y) < 1e-10, 1e-10, y)
+    discount, d_discount = _bond_discount_terms(m, t, y)
+    discrete = m <= 10000
+    base = np.where(discrete, 1 + y / m, 1.0)
+    dd_discount = t * (t + np.where(discrete, 1 / m, 0.0)) * discount / base ** 2
+    annuity = (1 - discount) / y
+    price = fv * discount + coup * annuity
+    slope = fv * d_discount - coup * (annuity + d_discount) / y
+    curvature = fv * dd_discount + coup * (2 * (annuity + d_discount) / y - dd_discount) / y
+    return price, slope, curvature
+
+
+def bond_price_sweep(face_value, coupons, coupons_per_period, yields, periods, shifts):
+    # Every bond (rows) repriced after every parallel yield shift (columns). Returns (exact,
+    # duration-only estimate, duration + convexity estimate), each (bonds x shifts); the
+    # duration-only estimate is the new price ChangeInBondPrice reports.
+    fv, coup, m, y, t = (a.reshape(-1, 1) for a in _as_float_arrays(
+        face_value, coupons, coupons_per_period, yields, periods))
+    shifts = np.asarray(shifts, dtype=float).reshape(1, -1)
+    price, slope, curvature = _bond_price_terms(fv, coup, m, t, y)
+    exact = bond_price_batch(fv, coup, m, y + shifts, t)
+    duration_only = price + slope * shifts
+    return exact, duration_only, duration_only + curvature * shifts ** 2 / 2
+
+
+def _safeguarded_newton(func, lower, upper, guess, tol, x_tol=1e-12, max_iter=100):
+    # func(x, idx) returns (f, df) for the entries idx; every entry keeps its own bracket
+    # [lo, hi] and bisects whenever a Newton step would leave it or shrinks too slowly.
+    lo = np.array(lower, dtype=float)
+    hi = np.array(upper, dtype=float)
+    everything = np.arange(lo.size)
+    f_lo = func(lo, everything)[0]
+    f_hi = func(hi, everything)[0]
+    bracketed = np.sign(f_lo) * np.sign(f_hi) <= 0
+
+    x = np.clip(np.broadcast_to(np.asarray(guess, dtype=float), lo.shape), np.minimum(lo, hi),
+                np.maximum(lo, hi))
+    tol = np.broadcast_to(np.asarray(tol, dtype=float), lo.shape)
+    last_step = np.abs(hi - lo)
+    converged = np.zeros(lo.shape, dtype=bool)
+    active = np.flatnonzero(bracketed)
+    iterations = 0
+    for _ in range(max_iter):
+        if not active.size:
+            break
+        iterations += 1
+        x_act = x[active]
+        f, df = func(x_act, active)
+        hit = np.abs(f) <= tol[active]
+
+        same_side = np.sign(f) == np.sign(f_lo[active])
+        lo[active] = np.where(same_side, x_act, lo[active])
+        f_lo[active] = np.where(same_side, f, f_lo[active])
+        hi[active] = np.where(same_side, hi[active], x_act)
+
+        a, b = np.minimum(lo[active], hi[active]), np.maximum(lo[active], hi[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_new = x_act - f / df
+        slow = np.abs(2 * f) > np.abs(last_step[active] * df)
+        bisect = ~np.isfinite(x_new) | (x_new <= a) | (x_new >= b) | slow
+        x_new = np.where(bisect, (a + b) / 2, x_new)
+        last_step[active] = np.abs(x_new - x_act)
+        settled = np.abs(x_new - x_act) <= x_tol
+
+        x[active] = np.where(hit, x_act, x_new)
+        converged[active[hit | settled]] = True
+        active = active[~(hit | settled)]
+
+    instrumentation.count("solver_iterations", iterations)
+    x[~bracketed] = np.nan
+    return x, converged
+
+
+def yield_to_maturity_batch(face_value, coupons, coupons_per_period, bond_prices, periods,
+                            lower=-0.99, upper=1.0, guess=0.1, tol=1e-8, max_iter=100):
+    # Returns (yields, converged); yields are nan where the price is outside [lower, upper]
+    arrays = _as_float_arrays(face_value, coupons, coupons_per_period, bond_prices, periods)
+    shape = arrays[0].shape
+    fv, coup, m, bp, t = (a.ravel() for a in arrays)
+
+    def price_gap(y, idx):
+        price, slope = _bond_price_and_slope(fv[idx], coup[idx], m[idx], t[idx], y)
+        return price - bp[idx], slope
+
+    lower = np.full(fv.shape, lower, dtype=float)
+    upper = np.full(fv.shape, upper, dtype=float)
+    yields, converged = _safeguarded_newton(price_gap, lower, upper, guess, tol,
+                                            max_iter=max_iter)
+    return yields.reshape(shape), converged.reshape(shape)
+
+
+def pad_cashflows(streams):
+    # Ragged cashflow streams -> (streams x longest stream) array, zero padded at the end
+    streams = [np.asarray(stream, dtype=float).ravel() for stream in streams]
+    lengths = np.array([stream.size for stream in streams], dtype=int)
+    padded = np.zeros((len(streams), lengths.max(initial=0)))
+    padded[np.arange(padded.shape[1]) < lengths[:, None]] = np.concatenate(streams or [[]])
+    return padded
+
+
+def _irr_brackets(cf, years, grid, guess):
+    # (lo, hi, has_root, roots_found) per stream from the NPV signs on a rate grid; the
+    # bracket is the grid interval with a sign change closest to guess
+    # Near r = -1 long streams overflow to inf (or nan); those grid points just never bracket
+    with np.errstate(over="ignore", invalid="ignore"):
+        npv_grid = cf @ (1 + grid[None, :]) ** -years[:, None]
+    signs = np.sign(npv_grid)
+    crossing = signs[:, :-1] * signs[:, 1:] <= 0
+    roots_found = (signs[:, :-1] * signs[:, 1:] < 0).sum(axis=1) + (signs == 0).sum(axis=1)
+
+    midpoints = (grid[:-1] + grid[1:]) / 2
+    distance = np.where(crossing, np.abs(midpoints - guess), np.inf)
+    nearest = distance.argmin(axis=1)
+    has_root = np.isfinite(distance[np.arange(cf.shape[0]), nearest])
+    lo = np.where(has_root, grid[nearest], grid[0])
+    hi = np.where(has_root, grid[nearest + 1], grid[0])
+    return lo, hi, has_root, roots_found
+
+
+def internal_rate_batch(cashflows, guess=0.1, lower=-0.99, upper=10.0, max_upper=1e6,
+                        grid_size=200, tol=1e-10, max_iter=100):
+    # Returns (rates, converged, roots_found). roots_found counts the sign changes of the NPV
+    # on a rate grid over [lower, upper], extended up to max_upper for the streams without
+    # one: 0 means no IRR in [lower, max_upper] (rate is nan), more than 1 means several IRRs
+    # and the one closest to guess is returned.
+    cf = np.asarray(cashflows, dtype=float) if isinstance(cashflows, np.ndarray) \
+        else pad_cashflows(cashflows)
+    cf = np.atleast_2d(cf)
+    # Start Year only scales an NPV by a positive (1 + r) ** -start, so it never moves the roots
+    years = np.arange(cf.shape[1])
+
+    grid = np.expm1(np.linspace(np.log1p(lower), np.log1p(upper), grid_size))
+    lo, hi, has_root, roots_found = _irr_brackets(cf, years, grid, guess)
+    missing = np.flatnonzero(~has_root)
+    if missing.size and max_upper > upper:
+        wide = np.expm1(np.linspace(np.log1p(upper), np.log1p(max_upper), grid_size))
+        lo[missing], hi[missing], has_root[missing], roots_found[missing] = \
+            _irr_brackets(cf[missing], years, wide, guess)
+
+    def npv_and_slope(rate, idx):
+        with np.errstate(over="ignore", invalid="ignore"):
+            growth = (1 + rate[:, None]) ** -years[None, :]
+            flows = cf[idx] * growth
+            return flows.sum(axis=1), -(flows * years).sum(axis=1) / (1 + rate)
+
+    scale = np.maximum(np.abs(cf).sum(axis=1), 1.0)
+    rates, converged = _safeguarded_newton(npv_and_slope, lo, hi, guess, tol * scale,
+                                           max_iter=max_iter)
+    rates[~has_root] = np.nan
+    converged &= has_root
+    return rates, converged, roots_found
+
+
+def discount_factors(rate, times, compound, custom=None):
+    # Discount vector for every time in times under one of the compounding_methods
+    times = np.asarray(times, dtype=float)
+    rate = np.asarray(rate, dtype=float)
+    if compound == "Continuous":
+        return np.exp(-rate * times)
+    m = custom if compound == "Custom" else compounding_methods[compound]
+    return (1 + rate / m) ** -(times * m)
+
+
+def cashflow_value_batch(cashflows, rate, start_year, compound, custom=None):
+    # Present value of many (possibly ragged) cashflow streams discounted at one rate
+    cf = np.asarray(cashflows, dtype=float) if isinstance(cashflows, np.ndarray) \
+        else pad_cashflows(cashflows)
+    cf = np.atleast_2d(cf)
+    start_year = np.asarray(start_year, dtype=float)
+    years = np.arange(cf.shape[1])
+    if start_year.ndim == 0:
+        return cf @ discount_factors(rate, start_year + years, compound, custom)
+    factors = discount_factors(rate, start_year[:, None] + years[None, :], compound, custom)
+    return np.einsum("ij,ij->i", cf, factors)
+
+
+class DiscountCurve:
+    # Discount factors built once from a Spot Rate List (entry i is the spot rate for year
+    # i + 1) and a Compound Method. Every period and sub-period is precomputed on a grid;
+    # other times use spot rates interpolated linearly between years (flat past either end)
+    # and are memoized, so no factor is computed twice.
+    def __init__(self, spot_rates, compound, custom=None, steps_per_year=None):
+        self.spot_rates = np.asarray(spot_rates, dtype=float)
+        self.rate_convention = "spot"
+        self.compound = compound
+        self.custom = custom
+        if compound == "Continuous":
+            self.m = None
+        else:
+            self.m = custom if compound == "Custom" else compounding_methods[compound]
+        self.steps_per_year = int(steps_per_year or self.m or 1)
+        self.grid_times = np.arange(self.spot_rates.size * self.steps_per_year + 1) \
+            / self.steps_per_year
+        self.grid_factors, self.grid_slopes, self.grid_curvatures = \
+            self.compute_terms(self.grid_times)
+        self.memo = {}
+
+    @classmethod
+    def from_yearly_rates(cls, yearly_rates, percent=False, steps_per_year=None):
+        # Curve whose year t factor is 1 / ((1 + r_1) ... (1 + r_t)) for one-year rates r_i,
+        # the convention PaymentLoanVariedRates reads its Spot Rate List in (as percentages)
+        rates = np.asarray(yearly_rates, dtype=float) / (100 if percent else 1)
+        years = np.arange(1, rates.size + 1)
+        curve = cls(np.exp(np.cumsum(np.log1p(rates)) / years) - 1, "Annual",
+                    steps_per_year=steps_per_year)
+        curve.rate_convention = "yearly"
+        return curve
+
+    def spot(self, times):
+        return np.interp(times, np.arange(1, self.spot_rates.size + 1), self.spot_rates)
+
+    def step_spot(self, times):
+        # Spot rate of the year each time falls in, held constant over its sub-periods (the
+        # way the scalar bond calculations read a Spot Rate List)
+        years = np.ceil(np.asarray(times, dtype=float) - 1e-9).astype(int)
+        return self.spot_rates[np.clip(years - 1, 0, self.spot_rates.size - 1)]
+
+    def compute_terms(self, times, spot=None):
+        # Factor with its first and second derivatives in a parallel shift of the spot rates
+        spot = self.spot(times) if spot is None else spot
+        factors = discount_factors(spot, times, self.compound, self.custom)
+        if self.m is None:
+            return factors, -times * factors, times ** 2 * factors
+        base = 1 + spot / self.m
+        return factors, -times * factors / base, times * (times + 1 / self.m) * factors / base ** 2
+
+    def grid_positions(self, times):
+        steps = times * self.steps_per_year
+        position = np.round(steps).astype(int)
+        on_grid = (np.abs(steps - position) < 1e-9) & (position >= 0) \
+            & (position < self.grid_times.size)
+        return on_grid, position
+
+    def terms(self, times):
+        times = np.asarray(times, dtype=float)
+        on_grid, position = self.grid_positions(times)
+        if on_grid.all():
+            return (self.grid_factors[position], self.grid_slopes[position],
+                    self.grid_curvatures[position])
+        terms = tuple(np.empty(times.shape) for _ in range(3))
+        for term, grid in zip(terms, (self.grid_factors, self.grid_slopes,
+                                      self.grid_curvatures)):
+            term[on_grid] = grid[position[on_grid]]
+        off_grid = times[~on_grid].tolist()
+        missing = [t for t in dict.fromkeys(off_grid) if t not in self.memo]
+        if missing:
+            self.memo.update(zip(missing, zip(*(a.tolist() for a in
+                                                self.compute_terms(np.array(missing))))))
+        for term, values in zip(terms, zip(*(self.memo[t] for t in off_grid))):
+            term[~on_grid] = values
+        return terms
+
+    def factors(self, times):
+        return self.terms(times)[0]
+
+    def cache_key(self):
+        return ["DiscountCurve", self.spot_rates, self.compound, self.custom, self.steps_per_year,
+                self.rate_convention]
+
+    def period_factors(self, periods=None):
+        # Factors for years 1..periods (default: every year of the spot-rate list)
+        periods = self.spot_rates.size if periods is None else int(periods)
+        return self.factors(np.arange(1, periods + 1))
+
+
+def bond_cashflow_matrix(face_values, coupons, periods, horizon):
+    # (bonds x years) cash of annual-coupon bonds over years 1..horizon
+    face_values, coupons, periods = (np.atleast_1d(np.asarray(a, dtype=float))[:, None] for a
+                                     in np.broadcast_arrays(face_values, coupons, periods))
+    years = np.arange(1, horizon + 1)[None, :]
+    return coupons * (years <= periods) + face_values * (years == periods)
+
+
+def bond_risk_measures(cashflows, curve):
+    # Present value, quasi-modified duration and convexity of every row of cashflows, which
+    # has one column per year starting at year 1
+    factors, slope, curvature = curve.terms(np.arange(1, np.shape(cashflows)[-1] + 1))
+    present_value = cashflows @ factors
+    return present_value, -(cashflows @ slope) / present_value, \
+        (cashflows @ curvature) / present_value
+
+
+def key_rate_bumps(key_tenors, horizon):
+    # (keys x years) weights of each key-rate bump over years 1..horizon: 1 at its own tenor,
+    # falling linearly to 0 at the neighbouring tenors and flat past the first and last
+    keys = np.asarray(key_tenors, dtype=float)
+    if keys.ndim != 1 or keys.size == 0 or np.any(np.diff(keys) <= 0):
+        raise ValueError("Key Tenors must be a non-empty list of strictly increasing years")
+    years = np.arange(1, horizon + 1)
+    return np.array([np.interp(years, keys, row) for row in np.eye(keys.size)])
+
+
+def curve_shock_values(cashflows, spot_rates, shocks, compound, custom=None):
+    # (bonds x scenarios) present values of cashflows (one column per year from year 1,
+    # dense or sparse) with every row of shocks (scenarios x years) added to the spot rates
+    years = np.arange(1, cashflows.shape[1] + 1)
+    spot = np.asarray(spot_rates, dtype=float)[:years.size]
+    factors = discount_factors(spot + np.atleast_2d(shocks)[:, :years.size], years, compound,
+                               custom)
+    return cashflows @ factors.T
+
+
+def key_rate_durations(spot_rates, key_tenors, face_values, coupons, periods, compound,
+                       custom=None, bump=1e-4, cashflows=None):
+    # Returns (present values, key-rate durations (bonds x keys)) from central bumps of each
+    # key rate; a bond's key-rate durations add up to its duration under a parallel bump.
+    # cashflows (bonds x years) replaces face_values, coupons and periods when given.
+    spot_rates = np.asarray(spot_rates, dtype=float)
+    if cashflows is None:
+        if np.max(periods) > spot_rates.size:
+            raise ValueError(f"Spot Rate List only covers {spot_rates.size} years")
+        cashflows = bond_cashflow_matrix(face_values, coupons, periods, spot_rates.size)
+    bumps = bump * key_rate_bumps(key_tenors, cashflows.shape[1])
+    shocks = np.vstack([np.zeros((1, bumps.shape[1])), bumps, -bumps])
+    values = curve_shock_values(cashflows, spot_rates, shocks, compound, custom)
+    keys = bumps.shape[0]
+    present_value = values[:, 0]
+    up, down = values[:, 1:keys + 1], values[:, keys + 1:]
+    return present_value, (down - up) / (2 * bump * present_value[:, None])
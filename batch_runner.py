@@ -0,0 +1,160 @@
+# Headless batch mode: streams value dicts through calculation_key without any prompts
+#   python batch_runner.py bonds.jsonl -o results.jsonl
+#   cat loans.csv | python batch_runner.py - --format csv
+import argparse
+import contextlib
+import csv
+import functools
+import json
+import os
+import sys
+
+import calc_manager
+import instrumentation
+import result_store
+from deterministic_calc import determ_key
+from main import calculation_key
+
+
+def parse_cell(cell: str):
+    cell = cell.strip()
+    if cell == "":
+        return None
+    if cell[0] in "[{":
+        return json.loads(cell)  # list entries such as Cashflow or Spot Rate List
+    try:
+        return float(cell.replace(",", ""))
+    except ValueError:
+        return cell  # Compound Method and other text entries
+
+
+# Readers yield one record per row, or the exception that row raised so the run can go on
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        try:
+            yield {key: parsed for key, parsed in ((key, parse_cell(cell or ""))
+                                                   for key, cell in row.items())
+                   if parsed is not None}
+        except ValueError as e:
+            yield e
+
+
+def to_jsonable(answer):
+    if hasattr(answer, "tolist"):  # numpy arrays and scalars
+        return answer.tolist()
+    if isinstance(answer, (list, tuple)):
+        return [to_jsonable(item) for item in answer]
+    return answer
+
+
+def run_record(record: dict, use_cache=True):
+    values = dict(record)
+    name = values.pop("Calculation", None)
+    if name not in calculation_key:
+        raise ValueError(f"Unknown calculation {name!r}")
+    calc = calculation_key[name](values)
+    if not calc.valid:
+        raise ValueError(f"Missing {calc.missing_values}")
+    with contextlib.redirect_stdout(sys.stderr):  # keep calculation chatter out of the results
+        compute = calc.calculate
+        if result_store.result_store is not None and calc.persist_results:
+            compute = functools.partial(result_store.result_store.calculate, name, calc, use_cache)
+        if calc_manager.result_cache is not None and name in determ_key:
+            return to_jsonable(calc_manager.result_cache.calculate(name, calc, use_cache, compute))
+        return to_jsonable(compute())
+
+
+def evaluate_row(row: int, record):
+    name = record.get("Calculation") if isinstance(record, dict) else None
+    try:
+        if isinstance(record, Exception):
+            raise record
+        if not isinstance(record, dict):
+            raise ValueError("Record is not a JSON object")
+        return {"row": row, "calculation": name, "result": run_record(record)}
+    except Exception as e:
+        return {"row": row, "calculation": name, "error": f"{type(e).__name__}: {e}"}
+
+
+def run_batch(source, output, file_format="jsonl", workers=0, chunksize=1, ordered=True,
+              timeout=None, cache_size=0, store_dir=None):
+    reader = read_csv(source) if file_format == "csv" else read_jsonl(source)
+    if workers:
+        from parallel_runner import run_records_parallel
+        results = run_records_parallel(reader, workers, chunksize, ordered, timeout,
+                                       cache_size=cache_size, store_dir=store_dir)
+    else:
+        if cache_size:
+            calc_manager.enable_result_cache(cache_size)
+        if store_dir:
+            result_store.enable_result_store(store_dir)
+        results = (evaluate_row(row, record) for row, record in enumerate(reader, 1))
+    completed = failed = 0
+    for result in results:
+        output.write(json.dumps(result) + "\n")
+        if "error" in result:
+            failed += 1
+        else:
+            completed += 1
+    output.flush()
+    return completed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run FinCalc calculations without prompts")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL or CSV file, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file, - for stdout")
+    parser.add_argument("--format", choices=["jsonl", "csv"],
+                        help="input format (default: from the file extension, else jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="worker processes (default: run in this process)")
+    parser.add_argument("--chunksize", type=int, default=64, help="records per worker task")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write results as they finish instead of in input order")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per record")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="remember this many recent results per process (default: off)")
+    parser.add_argument("--store-dir",
+                        help="keep solver results in a persistent store in this directory")
+    parser.add_argument("--profile", help="write per-calculation timings and counters as JSON")
+    parser.add_argument("--trace", help="write a Chrome trace (chrome://tracing, Perfetto)")
+    args = parser.parse_args(argv)
+    if (args.profile or args.trace) and args.workers:
+        parser.error("--profile and --trace record this process only; drop --workers")
+
+    file_format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    if args.output == "-":
+        # Results own stdout; anything else printing to it (solver logs included) goes to stderr
+        output = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    else:
+        output = open(args.output, "w")
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    if args.profile or args.trace:
+        instrumentation.enable_instrumentation()
+    with source, output:
+        completed, failed = run_batch(source, output, file_format, args.workers, args.chunksize,
+                                      not args.unordered, args.timeout, args.cache_size,
+                                      args.store_dir)
+    recorder = instrumentation.disable_instrumentation()
+    if recorder is not None:
+        if args.profile:
+            recorder.save_json(args.profile)
+        if args.trace:
+            recorder.save_chrome_trace(args.trace)
+    print(f"{completed} completed, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
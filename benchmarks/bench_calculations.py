@@ -0,0 +1,212 @@
+# Benchmark suite for every determ_key and single_rand_key calculation, the batch kernels and
+# the solvers. Results are saved as JSON baselines and compared run to run:
+#   python benchmarks/bench_calculations.py --save baseline.json
+#   python benchmarks/bench_calculations.py --compare baseline.json
+import argparse
+import contextlib
+import functools
+import io
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import numpy as np
+
+import batch_calc
+import solver_calc
+from deterministic_calc import OptimizeBondsForObligations, determ_key
+from single_period_random_calc import single_rand_key
+
+SPOT_RATES = [.0767, .0827, .0881, .0931, .0975, .1016, .1052, .1085, .1115, .1142, .1167, .1189]
+
+# One session that satisfies the requirements of every calculation
+SESSION = {
+    "Present Value": 1000.0, "Future Value": 1500.0, "Interest Rate": .05, "Periods": 10,
+    "Compound Method": "Annual", "Effective Rate": .06, "Start Year": 0.0,
+    "Cashflow": [-1000.0] + [50.0] * 9 + [1050.0],
+    "Nominal Principal": 200000.0, "Principal": 200000.0, "Payments": 1500.0,
+    "Perpetual Value": 100.0,
+    "Face Value": 1000.0, "Coupons": 50.0, "Coupons per Period": 2, "Yield": .05,
+    "Bond Price": 950.0, "New Yield": .055, "Spot Rate List": SPOT_RATES,
+    "First Spot Year": 1.0, "First Spot Value": .05, "Second Spot Year": 2.0,
+    "Second Spot Value": .055, "Forward Rate": .06,
+    "Change in Bond Price": -20.0, "Change in Yield": .005, "Modified Duration": 7.5,
+    "Project (cost/worth)": [[100.0, 20.0, 150.0, 50.0, 50.0, 150.0, 150.0],
+                             [300.0, 50.0, 350.0, 110.0, 100.0, 250.0, 200.0]],
+    "Budget": 500.0,
+    "Bond Yield List": [.005, .01, .015, .02, .025, .03, .035, .04, .045, .05],
+    "Obligations List": [150, 250, 400, 550, 700, 850, 1000, 1200, 1300, 1400],
+    "Face Value #1": 100, "Coupons #1": 6, "Coupons per Period #1": 1, "Periods #1": 12,
+    "Face Value #2": 100, "Coupons #2": 10, "Coupons per Period #2": 1, "Periods #2": 5,
+    "Face Value List": [100] * 10, "Coupon List": [10, 7, 8, 6, 7, 5, 10, 8, 7, 0],
+    "Periods List": [12, 10, 9, 8, 7, 6, 5, 3, 2, 1],
+    "Obligation List": [100, 200, 800, 100, 800, 1200],
+    "Bond Price List": [109, 94.8, 99.5, 93.1, 97.2, 92.9, 110, 104, 102, 95.2],
+    "Amount Received": 1100.0, "Amount Invested": 1000.0,
+}
+
+BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def time_call(func, min_time=0.05, repeat=5):
+    # Best seconds per call over repeat rounds, each long enough to be measured reliably
+    with contextlib.redirect_stdout(io.StringIO()):  # some calculations print their answer
+        calls = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or calls >= 1_000_000:
+                break
+            calls *= 10 if elapsed < min_time / 10 else 2
+        best = elapsed / calls
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def calculate(calc):
+    return calc(SESSION).calculate()
+
+
+def scalar_benchmarks():
+    cases = {**determ_key, **single_rand_key,
+             "Optimize Bonds For Obligations": OptimizeBondsForObligations}
+    for name, calc in cases.items():
+        yield f"scalar/{name}", functools.partial(calculate, calc)
+
+
+def batch_benchmarks(max_size):
+    rng = np.random.default_rng(0)
+    for size in (s for s in BATCH_SIZES if s <= max_size):
+        face = np.full(size, 1000.0)
+        coupons = rng.uniform(0, 80, size)
+        frequency = rng.choice([1, 2, 4, 12], size)
+        yields = rng.uniform(.01, .1, size)
+        periods = rng.integers(1, 31, size).astype(float)
+        prices = batch_calc.bond_price_batch(face, coupons, frequency, yields, periods)
+        yield f"batch/bond_price/{size}", functools.partial(
+            batch_calc.bond_price_batch, face, coupons, frequency, yields, periods)
+        yield f"batch/yield_to_maturity/{size}", functools.partial(
+            batch_calc.yield_to_maturity_batch, face, coupons, frequency, prices, periods)
+        streams = np.hstack([-rng.uniform(500, 1500, (size, 1)), rng.uniform(0, 300, (size, 10))])
+        yield f"batch/cashflow_value/{size}", functools.partial(
+            batch_calc.cashflow_value_batch, streams, .05, 0, "Monthly")
+        if size <= 100_000:  # the IRR bracket scan is (streams x grid)
+            yield f"batch/internal_rate/{size}", functools.partial(
+                batch_calc.internal_rate_batch, streams)
+
+
+def solver_benchmarks(scale):
+    rng = np.random.default_rng(1)
+    for n in [10, 100, 1000][:scale]:
+        costs = rng.integers(1, 100, n)
+        worths = rng.uniform(1, 100, n)
+        yield f"solver/optimal_projects/{n}", functools.partial(
+            solver_calc.optimal_projects, costs, worths, costs.sum() / 3)
+    for n in [100, 1000, 10000][:scale]:
+        coupons = rng.uniform(0, 8, n)
+        maturities = rng.integers(1, 31, n)
+        prices = 100 + (coupons - 4) * maturities * .8 + rng.normal(0, 1, n)
+        obligations = rng.uniform(1000, 50000, 30)
+        yield f"solver/match_obligations/{n}", functools.partial(
+            solver_calc.match_obligations, coupons, np.full(n, 100.0), maturities, prices,
+            obligations)
+    for n in [12, 120, 480][:scale]:
+        rates = np.linspace(.01, .05, n)
+        obligations = rng.uniform(100, 1000, n)
+        yield f"solver/optimize_par_bonds/{n}", functools.partial(
+            solver_calc.optimize_par_bonds, rates, 100, n, obligations)
+    for n in [2, 50, 500][:scale]:
+        coupons = rng.uniform(0, 10, n)
+        maturities = rng.integers(1, 31, n)
+        obligations = rng.uniform(100, 800, 20)
+        yield f"solver/immunize_portfolio/{n}", functools.partial(
+            solver_calc.immunize_portfolio, np.linspace(.03, .06, 30), np.full(n, 100), coupons,
+            maturities, obligations, "Annual")
+    for n in [10, 100, 1000][:scale]:
+        coupons = rng.uniform(0, 8, 200)
+        maturities = rng.integers(1, 31, 200)
+        prices = 100 + (coupons - 4) * maturities * .8 + rng.normal(0, 1, 200)
+        scenarios = solver_calc.ObligationScenarios.for_bonds(coupons, np.full(200, 100.0),
+                                                              maturities, prices, 30)
+        obligations = rng.uniform(1000, 50000, (n, 30))
+        yield f"solver/obligation_scenarios/{n}", functools.partial(scenarios.solve, obligations)
+
+
+def run(max_size, scale, only=None):
+    benchmarks = [*scalar_benchmarks(), *batch_benchmarks(max_size), *solver_benchmarks(scale)]
+    results = {}
+    for name, func in benchmarks:
+        if only and only not in name:
+            continue
+        results[name] = time_call(func)
+        print(f"{name:<55} {results[name] * 1e6:14.2f} us", file=sys.stderr)
+    return {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__,
+                 "machine": platform.machine(), "platform": platform.platform(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    # Prints a report and returns the names that got slower by more than threshold
+    regressions = []
+    print(f'{"benchmark":<55} {"baseline us":>14} {"current us":>14} {"ratio":>7}')
+    for name, seconds in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<55} {'-':>14} {seconds * 1e6:14.2f} {'new':>7}")
+            continue
+        ratio = seconds / before
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<55} {before * 1e6:14.2f} {seconds * 1e6:14.2f} {ratio:7.2f}{flag}")
+    skipped = len(baseline["results"].keys() - current["results"].keys())
+    if skipped:
+        print(f"{skipped} baseline benchmark(s) not run")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FinCalc calculations")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown reported as a regression (default 0.25)")
+    parser.add_argument("--max-size", type=int, default=1_000_000,
+                        help="largest batch size to run (default 10^6)")
+    parser.add_argument("--quick", action="store_true",
+                        help="batches up to 10^4 and only the smallest solver problems")
+    parser.add_argument("--only", help="run only benchmarks whose name contains this text")
+    args = parser.parse_args(argv)
+
+    max_size = min(args.max_size, 10_000) if args.quick else args.max_size
+    current = run(max_size, 1 if args.quick else 3, args.only)
+    if args.save:
+        Path(args.save).write_text(json.dumps(current, indent=2))
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
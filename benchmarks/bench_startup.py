@@ -0,0 +1,41 @@
+# Import-time benchmark: compares the lazy solver backends against importing them up front
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "lazy (import main)": "import main",
+    "eager (numpy, scipy.optimize, pulp + main)": "import numpy, scipy.optimize, pulp; import main",
+    "first closed-form calc": "import main; from deterministic_calc import BondPrice; "
+                              "BondPrice({'Face Value': 1000, 'Coupons': 50, "
+                              "'Coupons per Period': 2, 'Yield': .05, 'Periods': 10}).calculate()",
+}
+
+
+def time_import(statement, repeat):
+    timings = []
+    for _ in range(repeat):
+        code = f"import time; s = time.perf_counter(); {statement}; " \
+               f"print(time.perf_counter() - s)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main(repeat=7):
+    results = {}
+    for name, statement in SCENARIOS.items():
+        results[name] = statistics.median(time_import(statement, repeat))
+        print(f'{name:<45}: {results[name] * 1000:8.1f} ms')
+    eager = results["eager (numpy, scipy.optimize, pulp + main)"]
+    lazy = results["lazy (import main)"]
+    print(f'{"import-time gain":<45}: {(eager - lazy) * 1000:8.1f} ms ({eager / lazy:.1f}x)')
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
@@ -0,0 +1,76 @@
+# Bond portfolios stored as one sparse (bonds x time buckets) cashflow matrix, built once, so
+# valuing, risking or laddering the whole book is a sparse product against a discount vector
+import math
+
+import numpy as np
+from scipy import sparse
+from batch_calc import discount_factors
+
+
+class BondPortfolio:
+    # Bond i pays coupons[i] / m a year in m = coupons_per_period[i] instalments and its face
+    # value at maturity (periods[i] years), as in BondPrice. Bucket j is paid at
+    # (j + 1) / steps_per_year years, steps_per_year being the lcm of the payment frequencies;
+    # grids wider than max_buckets are refused rather than built.
+    def __init__(self, face_values, coupons, coupons_per_period, periods, max_buckets=1_000_000):
+        face_values, coupons, m, periods = (np.atleast_1d(a) for a in np.broadcast_arrays(
+            *(np.asarray(a, dtype=float) for a in (face_values, coupons, coupons_per_period,
+                                                  periods))))
+        if np.any(m != np.round(m)) or np.any(m < 1):
+            raise ValueError("Coupons per Period must be whole numbers of payments a year")
+        if np.any(m > 10000):
+            raise ValueError("Coupons per Period over 10000 is continuous in BondPrice and has "
+                             "no payment grid; price those bonds with bond_price_batch")
+        m = m.astype(np.int64)
+        longest = float(periods.max(initial=0))
+        self.steps_per_year = 1
+        for frequency in np.unique(m).tolist():  # python ints, so the lcm cannot overflow
+            self.steps_per_year = math.lcm(self.steps_per_year, frequency)
+            if self.steps_per_year * longest > max_buckets:
+                raise ValueError(f"Payment frequencies {np.unique(m).tolist()} need "
+                                 f"{self.steps_per_year} buckets a year over {longest:g} "
+                                 f"years, more than max_buckets={max_buckets}")
+        counts = np.rint(m * periods).astype(np.int64)
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        bonds = np.repeat(np.arange(counts.size), counts)
+        payment = np.arange(indptr[-1]) - indptr[bonds] + 1
+        buckets = payment * (self.steps_per_year // m)[bonds]
+        cash = (coupons / m)[bonds] + np.where(payment == counts[bonds], face_values[bonds], 0.0)
+        width = int(buckets.max(initial=0))
+        index = np.int32 if indptr[-1] < 2 ** 31 else np.int64  # int32 halves the index memory
+        self.cashflows = sparse.csr_array((cash, (buckets - 1).astype(index),
+                                           indptr.astype(index)), shape=(counts.size, width))
+        self.times = np.arange(1, width + 1) / self.steps_per_year
+
+    @property
+    def nbytes(self):
+        return self.cashflows.data.nbytes + self.cashflows.indices.nbytes \
+            + self.cashflows.indptr.nbytes
+
+    def discount_vector(self, rate, compound, custom=None):
+        # Factors for every bucket at one flat rate
+        return discount_factors(rate, self.times, compound, custom)
+
+    def present_values(self, factors):
+        # Present value of every bond against a discount vector (one factor per bucket)
+        return self.cashflows @ factors
+
+    def risk_measures(self, curve):
+        # (present value, quasi-modified duration, convexity) of every bond on a DiscountCurve
+        terms = np.column_stack(curve.terms(self.times))
+        present_value, slope, curvature = (self.cashflows @ terms).T
+        return present_value, -slope / present_value, curvature / present_value
+
+    def ladder(self, holdings=None):
+        # Cash the portfolio receives in every bucket, holding holdings units of each bond
+        if holdings is None:
+            return np.asarray(self.cashflows.sum(axis=0)).ravel()
+        return self.cashflows.T @ np.asarray(holdings, dtype=float)
+
+    def portfolio_measures(self, curve, holdings=None):
+        # (present value, quasi-modified duration, convexity) of the whole portfolio
+        ladder = self.ladder(holdings)
+        factors, slopes, curvatures = curve.terms(self.times)
+        present_value = ladder @ factors
+        return present_value, -(ladder @ slopes) / present_value, \
+            (ladder @ curvatures) / present_value
@@ -1,6 +1,12 @@
 
 
-import copy
+import hashlib
+import importlib
+import json
+import sys
+from collections import ChainMap, OrderedDict
+
+import instrumentation
 
 
 values_dict = {
@@ -90,6 +96,37 @@ compounding_methods = {
 }
 
 
+class LazyModule:
+    # Stands in for a module and only imports it on first attribute access
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+
+lazy_backends = {}
+
+
+def lazy_import(name):
+    if name not in lazy_backends:
+        lazy_backends[name] = LazyModule(name)
+    return lazy_backends[name]
+
+
+def value_view(values):
+    # Copy-on-write view of the entered values: reads fall through to the caller's dict and
+    # writes only land in this view's own top layer, so the inputs are never copied or changed
+    if isinstance(values, ChainMap):
+        top = dict(values.maps[0])
+        instrumentation.count("copy_bytes", sys.getsizeof(top))
+        return ChainMap(top, *values.maps[1:])
+    return ChainMap({}, values)
+
+
 def format_numeric_value(value):
     try:
         return f"{float(value):,}" if value != "" else ""
@@ -98,16 +135,24 @@ def format_numeric_value(value):
 
 
 class OutlineCalculation:
+    requirements = []
+    optional_requirements = []  # read only when present, e.g. "Custom"
+    persist_results = False  # worth keeping in the on-disk result_store
+
     def __init__(self, values:dict):
         self.calc = "Outline"
         self.title = "Custom Title"
-        self.requirements = []
-        self.values = copy.deepcopy(values)
+        self.values = value_view(values)
         self._original_values_ = values
         self.missing_values = []
         self.valid = False
         self.attempt_calc_failed = False
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "calculate" in cls.__dict__:
+            cls.calculate = instrumentation.traced(cls, cls.calculate)
+
     def validate_values(self):
         valid = True
         for item in self.requirements:
@@ -148,3 +193,145 @@ class OutlineCalculation:
                 print(f"Uncatalogued-- {item}: {self.values[item]}")
 
 
+
+
+class RequirementIndex:
+    # Compiles the class-level requirements of every calculation into bitmasks over the entry
+    # fields, so finding what can run (or what is missing) never builds a calculation
+    def __init__(self, calculations: dict):
+        self.fields = {name: bit for bit, name in enumerate(ingredients_catalog)}
+        self.requirements = {}
+        self.masks = {}
+        for key, calc in calculations.items():
+            mask = 0
+            for item in calc.requirements:
+                if item not in self.fields:
+                    self.fields[item] = len(self.fields)
+                mask |= 1 << self.fields[item]
+            self.requirements[key] = list(calc.requirements)
+            self.masks[key] = mask
+
+    def mask_of(self, values) -> int:
+        mask = 0
+        for item in values:
+            if item in self.fields:
+                mask |= 1 << self.fields[item]
+        return mask
+
+    def missing(self, key, values_mask: int) -> list:
+        absent = self.masks[key] & ~values_mask
+        return [item for item in self.requirements[key] if absent >> self.fields[item] & 1]
+
+    def similarity(self, key, values_mask: int) -> float:
+        needed = self.masks[key].bit_count()
+        if not needed:
+            return 1
+        return (self.masks[key] & values_mask).bit_count() / needed
+
+    def runnable(self, values) -> list:
+        values_mask = self.mask_of(values)
+        return [key for key, mask in self.masks.items() if mask & values_mask == mask]
+
+    def closest(self, values) -> list:
+        # Calculations sharing the most information with values that still miss something
+        values_mask = self.mask_of(values)
+        closest_calculations = []
+        max_similarity = -1
+        for key in self.masks:
+            similarity = self.similarity(key, values_mask)
+            if similarity >= 1:
+                similarity = 0
+            if similarity > max_similarity:
+                max_similarity = similarity
+                closest_calculations = [(key, self.missing(key, values_mask))]
+            elif similarity == max_similarity:
+                closest_calculations.append((key, self.missing(key, values_mask)))
+        return closest_calculations
+
+    def suggestions(self, values, min_similarity=0.0) -> list:
+        values_mask = self.mask_of(values)
+        return [(key, self.missing(key, values_mask)) for key in self.masks
+                if self.similarity(key, values_mask) > min_similarity]
+
+
+def canonical_value(value):
+    # Reduces an entry to plain JSON types so equal inputs always serialize the same way
+    if hasattr(value, "cache_key"):
+        return canonical_value(value.cache_key())
+    if hasattr(value, "tolist"):  # numpy arrays and scalars
+        value = value.tolist()
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): canonical_value(item) for key, item in value.items()}
+    raise TypeError(f"Cannot build a cache key from {type(value).__name__}")
+
+
+def calculation_key_hash(name, calc, version=""):
+    # Stable hash of a calculation name and only the inputs that calculation reads
+    fields = list(calc.requirements) + [item for item in calc.optional_requirements
+                                        if item in calc.values]
+    inputs = {item: canonical_value(calc.values[item]) for item in fields}
+    payload = json.dumps([version, name, inputs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    # Bounded LRU memo of calculate() results for pure (deterministic) calculations
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def calculate(self, name, calc, use_cache=True, compute=None):
+        # compute replaces calc.calculate on a miss, e.g. to go through a slower cache first
+        compute = compute or calc.calculate
+        if not use_cache or not calc.valid:
+            return compute()
+        try:
+            key = calculation_key_hash(name, calc)
+        except TypeError:  # an input that cannot be keyed is simply not cached
+            return compute()
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            result = self.entries[key]
+        else:
+            self.misses += 1
+            result = compute()
+            self.entries[key] = result
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if hasattr(result, "copy"):
+            copied = result.copy()
+            instrumentation.count("copy_bytes", getattr(copied, "nbytes", sys.getsizeof(copied)),
+                                  owner=type(calc).__name__)
+            return copied
+        return result
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                "maxsize": self.maxsize}
+
+
+result_cache = None  # opt in with enable_result_cache()
+
+
+def enable_result_cache(maxsize=4096):
+    global result_cache
+    result_cache = ResultCache(maxsize)
+    return result_cache
+
+
+def disable_result_cache():
+    global result_cache
+    result_cache = None
@@ -1,15 +1,23 @@
 
 import math
-import numpy as np
-from pulp import LpMaximize, LpMinimize, LpProblem, LpVariable, lpSum, value
-from scipy.optimize import linprog, newton
-from calc_manager import OutlineCalculation, compounding_methods, format_numeric_value
+import instrumentation
+from calc_manager import OutlineCalculation, compounding_methods, format_numeric_value, lazy_import
+
+#  Solver backends are only imported the first time a calculation needs them
+np = lazy_import("numpy")
+pulp = lazy_import("pulp")
+optimize = lazy_import("scipy.optimize")
+batch_calc = lazy_import("batch_calc")
+solver_calc = lazy_import("solver_calc")
+amortization = lazy_import("amortization")
 
 class FutureValue(OutlineCalculation):
+    requirements = ["Present Value", "Interest Rate", "Periods", "Compound Method"]
+    optional_requirements = ["Custom"]
+
     def __init__(self, values:dict):
         super().__init__(values)
         self.calc = "Future Value"  # include title
-        self.requirements = ["Present Value", "Interest Rate", "Periods", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.PV = self.values["Present Value"]
@@ -30,11 +38,13 @@ class FutureValue(OutlineCalculation):
 
 
 class PresentValue(OutlineCalculation):
+    requirements = ["Future Value", "Interest Rate", "Periods", "Compound Method"]
+    optional_requirements = ["Custom"]
+
     def __init__(self, values:dict):
         super().__init__(values)
         self.calc = "Present Value"
         self.title = "Present Value from Future Value"
-        self.requirements = ["Future Value", "Interest Rate", "Periods", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.FV = self.values["Future Value"]
@@ -55,11 +65,13 @@ class PresentValue(OutlineCalculation):
 
 
 class CashflowValue(OutlineCalculation):
+    requirements = ["Cashflow", "Interest Rate", "Start Year", "Compound Method"]
+    optional_requirements = ["Custom", "Discount Curve"]
+
     def __init__(self, values:dict):
         super().__init__(values)
         self.calc = "Cashflow"
         self.title = "Present Value of Cashflow"
-        self.requirements = ["Cashflow", "Interest Rate", "Start Year", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.cf_list = self.values["Cashflow"]
@@ -67,28 +79,28 @@ class CashflowValue(OutlineCalculation):
             self.starting = self.values["Start Year"]
             self.compound = self.values["Compound Method"]
             self.custom = self.values.get("Custom", None)
+            self.curve = self.values.get("Discount Curve", None)  # replaces the flat rate
 
     def calculate(self):
         super().calculate()
-        i = 0
-        present_accumulative = 0
-        for cash in self.cf_list:
-            self.values["Future Value"] = cash
-            self.values["Periods"] = self.starting + i
-            try:
-                present_accumulative += PresentValue(self.values).calculate()
-            except Exception:
-                print(self.values)
-            i += 1
+        cf = np.asarray(self.cf_list, dtype=float)
+        times = self.starting + np.arange(cf.size)
+        if self.curve is not None:
+            factors = self.curve.factors(times)
+        else:
+            factors = batch_calc.discount_factors(self.rate, times, self.compound, self.custom)
+        present_accumulative = float(cf @ factors)
         return str(format_numeric_value(present_accumulative)) + " in Present Value"
 
 
 class InternalRate(OutlineCalculation):
+    requirements = ["Cashflow", "Start Year"]
+    persist_results = True
+
     def __init__(self, values:dict):
         super().__init__(values)
         self.calc = "Internal Rate"
         self.title = "Internal Rate"
-        self.requirements = ["Cashflow", "Start Year"]
         self.valid = self.validate_values()
         if self.valid:
             self.cf_list = self.values["Cashflow"]
@@ -96,20 +108,24 @@ class InternalRate(OutlineCalculation):
 
     def calculate(self):
         super().calculate()
-        def calculate_irr(rate):
-            return sum([cf / ((1 + rate) ** (year + self.values["Start Year"]))
-                        for year, cf in enumerate(self.values['Cashflow'])])
-        answer = newton(calculate_irr, 0.10)
+        rates, converged, roots_found = batch_calc.internal_rate_batch([self.cf_list], guess=0.10)
+        if not converged[0]:
+            return "not found, the Net Present Value never changes sign for rates between " \
+                   "-99% and 100,000,000%"
+        if roots_found[0] > 1:
+            print(f'This cashflow has {roots_found[0]} Internal Rates, showing the closest to 10%')
+        answer = float(rates[0])
         print(f'The Rate in Percentage rounded to 2 decimal places is {round(answer * 100, 2)}%')
         return str(answer) + f' or {round(answer * 100, 2)}%'
 
 
 class NominalRate(OutlineCalculation):
+    requirements = ["Effective Rate", "Compound Method"]
+
     def __init__(self, values:dict):
         super().__init__(values)
         self.calc = "Nominal Rate"
         self.title = "Nominal Annual Rate"
-        self.requirements = ["Effective Rate", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.ER = self.values["Effective Rate"]
@@ -121,18 +137,20 @@ class NominalRate(OutlineCalculation):
         if compounding != "Continuous":
             def equation(rate):
                 return (1 + (rate / compounding))**compounding - 1 - self.ER
-            r = newton(equation, 0.10)
+            r, info = optimize.newton(equation, 0.10, full_output=True)
+            instrumentation.count("solver_iterations", info.iterations)
         else:
             r = math.log(self.ER + 1)
         return r
 
 
 class PaymentLoan(OutlineCalculation):
+    requirements = ["Nominal Principal", "Periods", "Interest Rate", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Payments for Loan"
         self.title = "Payments Needed For Loan based on Total Nominal Value Being Paid"
-        self.requirements = ["Nominal Principal", "Periods", "Interest Rate", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.p = self.values["Nominal Principal"]
@@ -147,12 +165,17 @@ class PaymentLoan(OutlineCalculation):
         n = compounding * self.periods
         return (r * (1 + r)**n * self.p) / ((1 + r)**n - 1)
 
+    def schedule(self):
+        # Period by period interest, principal and balance, generated lazily
+        return amortization.amortization_schedule(self.p, self.periods, self.rate, self.compound)
+
 
 class PerpetualValue(OutlineCalculation):
+    requirements = ["Perpetual Value", "Interest Rate"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Perpetual Value"
-        self.requirements = ["Perpetual Value", "Interest Rate"]
         self.valid = self.validate_values()
         if self.valid:
             self.prp = self.values["Perpetual Value"]
@@ -164,11 +187,12 @@ class PerpetualValue(OutlineCalculation):
 
 
 class PrincipalRemainingPV(OutlineCalculation):
+    requirements = ["Payments", "Periods", "Interest Rate", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Principal Remaining in Present Value"
         self.title = "Remaining Principal in Present Value"
-        self.requirements = ["Payments", "Periods", "Interest Rate", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.pay = self.values["Payments"]
@@ -183,13 +207,18 @@ class PrincipalRemainingPV(OutlineCalculation):
         n = compounding * self.periods
         return (self.pay / r) * (1 - 1 / (( 1 + r) ** n))
 
+    def schedule(self):
+        return amortization.amortization_schedule(self.calculate(), self.periods, self.rate,
+                                                  self.compound)
+
 
 class PrincipalRemainingNV(OutlineCalculation):
+    requirements = ["Payments", "Periods", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Principal Remaining in Nominal Value"
         self.title = "Remaining Principal in Nominal Value"
-        self.requirements = ["Payments", "Periods", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.pay = self.values["Payments"]
@@ -206,12 +235,13 @@ class PrincipalRemainingNV(OutlineCalculation):
 #  separate calc into more modules to clean code
 
 class BondPrice(OutlineCalculation):
+    requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
+                    "Periods"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Bond Price"
         self.title = "Bond Price in Present Value"
-        self.requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
-                             "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.fv = self.values["Face Value"]
@@ -234,12 +264,14 @@ class BondPrice(OutlineCalculation):
 
 
 class YieldToMaturity(OutlineCalculation):
+    requirements = ["Face Value", "Coupons", "Coupons per Period", "Bond Price",
+                    "Periods"]
+    persist_results = True
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Yield To Maturity"
         self.title = "Finding Yield To Maturity in Percent"
-        self.requirements = ["Face Value", "Coupons", "Coupons per Period", "Bond Price",
-                             "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.fv = self.values["Face Value"]
@@ -250,33 +282,22 @@ class YieldToMaturity(OutlineCalculation):
 
     def calculate(self):
         super().calculate()
-        ytm = .1  # initial ytm guess before bisect alg
-        lower_bound = -1
-        upper_bound = 1
-        tolerance = 0.000001
-        for i in range(100):
-            self.values["Yield"] = ytm
-            guessed_bond_price = BondPrice(self.values).calculate()
-            if abs(guessed_bond_price - self.bp) > tolerance:
-                if guessed_bond_price < self.bp:
-                    upper_bound = ytm
-                    ytm = (ytm + lower_bound) / 2
-                elif guessed_bond_price > self.bp:
-                    lower_bound = ytm
-                    ytm = (ytm + upper_bound) / 2
-            else:
-                return f"{ytm * 100}%"
+        ytm, converged = batch_calc.yield_to_maturity_batch(self.fv, self.coup, self.m, self.bp,
+                                                            self.periods)
+        if converged:
+            return f"{float(ytm) * 100}%"
         else:
             return "Outside of Upper and Lower Bounds"
 
 
 class MacaulayDuration(OutlineCalculation):
+    requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
+                    "Periods"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Macaulay Duration"
         self.title = "Macaulay Duration aka How Many Payments/Periods Left"
-        self.requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
-                             "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.fv = self.values["Face Value"]
@@ -298,12 +319,13 @@ class MacaulayDuration(OutlineCalculation):
 
 
 class ModifiedDuration(OutlineCalculation):
+    requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
+                    "Periods"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Modified Duration"
         self.title = "Modified Duration also known as Sensitivity"
-        self.requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield",
-                             "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.fv = self.values["Face Value"]
@@ -320,12 +342,13 @@ class ModifiedDuration(OutlineCalculation):
 
 
 class ChangeInBondPrice(OutlineCalculation):
+    requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield", "New Yield",
+                    "Periods"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Change In Bond Price"
         self.title = "Change in Bond Price based on New Yield"
-        self.requirements = ["Face Value", "Coupons", "Coupons per Period", "Yield", "New Yield",
-                             "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.fv = self.values["Face Value"]
@@ -343,14 +366,20 @@ class ChangeInBondPrice(OutlineCalculation):
         return str(answer) + f" or ${format_numeric_value(answer)} was the amount changed so the" \
                              f" new Price is:\n${format_numeric_value(answer + P)}"
 
+    def sweep(self, shifts):
+        # (exact, duration-only, duration + convexity) new prices for every yield shift
+        return batch_calc.bond_price_sweep(self.fv, self.coup, self.m, self.y, self.periods,
+                                           shifts)
+
 
 class ForwardRate(OutlineCalculation):
+    requirements = ["First Spot Year", "First Spot Value", "Second Spot Year",
+                    "Second Spot Value", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Forward Rate"
         self.title = "Forward Rate aka the Predicted Rate for the Second Year"
-        self.requirements = ["First Spot Year", "First Spot Value", "Second Spot Year",
-                             "Second Spot Value", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.i = self.values["First Spot Year"]
@@ -371,12 +400,13 @@ class ForwardRate(OutlineCalculation):
 
 
 class FirstSpotRate(OutlineCalculation):
+    requirements = ["First Spot Year", "Forward Rate", "Second Spot Year",
+                    "Second Spot Value", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "First Spot Rate"
         self.title = "Spot Rate aka Theoretical Yield for a Zero-Coup Bond for Second Year"
-        self.requirements = ["First Spot Year", "Forward Rate", "Second Spot Year",
-                             "Second Spot Value", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.i = self.values["First Spot Year"]
@@ -398,12 +428,13 @@ class FirstSpotRate(OutlineCalculation):
 
 
 class SecondSpotRate(OutlineCalculation):
+    requirements = ["First Spot Year", "First Spot Value", "Second Spot Year",
+                    "Forward Rate", "Compound Method"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Second Spot Rate"
         self.title = "Forward Rate aka the Predicted Rate for the Second Year"
-        self.requirements = ["First Spot Year", "First Spot Value", "Second Spot Year",
-                             "Forward Rate", "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.i = self.values["First Spot Year"]
@@ -425,12 +456,14 @@ class SecondSpotRate(OutlineCalculation):
 
 
 class QuasiModifiedDurationBond(OutlineCalculation):
+    requirements = ["Spot Rate List", "Face Value", "Coupons",
+                    "Coupons per Period", "Compound Method", "Periods"]
+    optional_requirements = ["Discount Curve"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Quasi-Modified Duration from Bond"
         self.title = "Quasi-Modified Duration aka Sensitivity"
-        self.requirements = ["Spot Rate List", "Face Value", "Coupons",
-                             "Coupons per Period", "Compound Method", "Periods"]
         self.valid = self.validate_values()
         if self.valid:
             self.y_list = self.values["Spot Rate List"]
@@ -438,9 +471,23 @@ class QuasiModifiedDurationBond(OutlineCalculation):
             self.coup = self.values["Coupons"]
             self.compound = self.values["Compound Method"]
             self.periods = self.values["Periods"]
+            self.curve = self.values.get("Discount Curve", None)
 
     def calculate(self):
         super().calculate()
+        if self.curve is not None:
+            if self.curve.compound != self.compound:
+                raise ValueError(f"Discount Curve compounds {self.curve.compound}, but the "
+                                 f"Compound Method is {self.compound}")
+            m = compounding_methods[self.compound]  # sub-periods follow compounding, not the grid
+            years = np.arange(1, int(self.periods) + 1)
+            cash = np.where(years == years[-1], self.coup + self.fv, self.coup)
+            steps = np.arange(1, int(self.periods) * m + 1)
+            sub_cash = np.where(steps == steps[-1], self.coup / m + self.fv, self.coup / m)
+            # Each year's rate covers all of its sub-periods, as in the path without a curve
+            times = steps / m
+            D = -(sub_cash @ self.curve.compute_terms(times, self.curve.step_spot(times))[1])
+            return D / (cash @ self.curve.factors(years))
         m = compounding_methods[self.compound]
         n = m * self.periods
         coup = self.coup / m
@@ -468,14 +515,16 @@ class QuasiModifiedDurationBond(OutlineCalculation):
 
 
 class ImmunizePortfolio(OutlineCalculation):
+    requirements = ["Spot Rate List", "Face Value #1", "Coupons #1",
+                    "Coupons per Period #1", "Periods #1", "Face Value #2", "Coupons #2",
+                    "Coupons per Period #2", "Periods #2", "Obligations List",
+                    "Compound Method"]
+    optional_requirements = ["Custom", "Discount Curve"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Immunize Portfolio"
         self.title = "Immunization for Portfolio aka Minimize Impact from Change of Yield"
-        self.requirements = ["Spot Rate List", "Face Value #1", "Coupons #1",
-                             "Coupons per Period #1", "Periods #1", "Face Value #2", "Coupons #2",
-                             "Coupons per Period #2", "Periods #2", "Obligations List",
-                             "Compound Method"]
         self.valid = self.validate_values()
         if self.valid:
             self.y_list = self.values["Spot Rate List"]
@@ -491,50 +540,84 @@ class ImmunizePortfolio(OutlineCalculation):
             self.compound = self.values["Compound Method"]
             self.cm1 = self.values["Compound Method"]  # Can be Changed Manually
             self.cm2 = self.values["Compound Method"]  # Can be Changed Manually
+            self.curve = self.values.get("Discount Curve", None)
 
     def calculate(self):
         super().calculate()
-        def FindPresentValue(fv, coup, periods, compound, y_list):
-            entry_P = {"Future Value": coup, "Compound Method": compound}
-            P = []
-            for i in range(1, periods + 1):
-                entry_P["Periods"] = i
-                if i == periods:
-                    entry_P["Future Value"] = coup + fv
-                entry_P["Interest Rate"] = y_list[i - 1]
-                P.append(PresentValue(entry_P).calculate())
-            return sum(P)
-        def FindQuasiDuration(y_list, fv_1, coup_1, m_1, p_1, compound):
-            entry_P = {"Spot Rate List": y_list, "Face Value": fv_1, "Coupons": coup_1,
-                       "Coupons per Period": m_1, "Periods": p_1, "Compound Method":compound}
-            return QuasiModifiedDurationBond(entry_P).calculate()
-        m = compounding_methods[self.compound]
-        P1 = FindPresentValue(self.fv_1, self.coup_1, self.p_1, self.cm1, self.y_list)
-        P2 = FindPresentValue(self.fv_2, self.coup_2, self.p_2, self.cm2, self.y_list)
-        D_1 = FindQuasiDuration(self.y_list, self.fv_1, self.coup_1, self.m_1, self.p_1, self.cm1)
-        D_2 = FindQuasiDuration(self.y_list, self.fv_2, self.coup_2, self.m_2, self.p_2, self.cm2)
-        PV_list = []
-        for i in range(len(self.obl_list)):
-            PV_list.append(PresentValue({"Future Value": self.obl_list[i], "Interest Rate":
-                self.y_list[i], "Periods": i + 1, "Compound Method": self.compound}).calculate())
-        PV_ob  = sum(PV_list)
-        Obl_list = []
-        for i in range(len(self.obl_list)):
-            for j in range(1, m + 1):
-                k = i * m + j
-                Obl_list.append(self.obl_list[i] * (k / m) * (1 + self.y_list[i] / m) ** (-(k + 1)))
-        D_obl = sum(Obl_list) / PV_ob
-        A = np.array([[P1, P2], [P1 * D_1, P2 * D_2]])
-        B = np.array([PV_ob, PV_ob * D_obl])
-        return np.linalg.solve(A, B)
+        return solver_calc.immunize_portfolio(self.y_list, [self.fv_1, self.fv_2],
+                                              [self.coup_1, self.coup_2], [self.p_1, self.p_2],
+                                              self.obl_list, self.compound,
+                                              self.values.get("Custom", None), method="solve",
+                                              curve=self.curve)
+
+
+class ImmunizePortfolioBonds(OutlineCalculation):
+    requirements = ["Spot Rate List", "Face Value List", "Coupon List", "Periods List",
+                    "Obligations List", "Compound Method"]
+    optional_requirements = ["Custom", "Discount Curve"]
+
+    def __init__(self, values: dict):
+        super().__init__(values)
+        self.calc = "Immunize Portfolio Bonds"
+        self.title = "Immunization for Portfolio from Any Number of Bonds"
+        self.valid = self.validate_values()
+        if self.valid:
+            self.y_list = self.values["Spot Rate List"]
+            self.fv_list = self.values["Face Value List"]
+            self.coup_list = self.values["Coupon List"]
+            self.period_list = self.values["Periods List"]
+            self.obl_list = self.values["Obligations List"]
+            self.compound = self.values["Compound Method"]
+            self.custom = self.values.get("Custom", None)
+            self.curve = self.values.get("Discount Curve", None)
+
+    def calculate(self):
+        super().calculate()
+        return solver_calc.immunize_portfolio(self.y_list, self.fv_list, self.coup_list,
+                                              self.period_list, self.obl_list, self.compound,
+                                              self.custom, curve=self.curve)
+
+
+class KeyRateDurations(OutlineCalculation):
+    requirements = ["Spot Rate List", "Face Value List", "Coupon List", "Periods List",
+                    "Compound Method"]
+    optional_requirements = ["Key Tenors", "Custom"]
+    default_tenors = [1, 2, 3, 5, 7, 10, 20, 30]
+
+    def __init__(self, values: dict):
+        super().__init__(values)
+        self.calc = "Key Rate Durations"
+        self.title = "Key-Rate Durations of every Bond"
+        self.valid = self.validate_values()
+        if self.valid:
+            self.y_list = self.values["Spot Rate List"]
+            self.fv_list = self.values["Face Value List"]
+            self.coup_list = self.values["Coupon List"]
+            self.period_list = self.values["Periods List"]
+            self.compound = self.values["Compound Method"]
+            self.custom = self.values.get("Custom", None)
+            horizon = len(self.y_list)
+            self.tenors = self.values.get("Key Tenors", None)
+            if self.tenors is None:
+                self.tenors = [t for t in self.default_tenors if t <= horizon] or [horizon]
+
+    def calculate(self):
+        super().calculate()
+        # (bonds x key tenors)
+        return batch_calc.key_rate_durations(self.y_list, self.tenors, self.fv_list,
+                                             self.coup_list, self.period_list, self.compound,
+                                             self.custom)[1]
 
 
 class OptimalProject(OutlineCalculation):
+    requirements = ["Project (cost/worth)", "Budget"]
+    persist_results = True
+    native_project_limit = 20_000  # bigger project lists go straight to PuLP
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Optimal Projects"
         self.title = "Optimal number of Projects to Do"
-        self.requirements = ["Project (cost/worth)", "Budget"]
         self.valid = self.validate_values()
         if self.valid:
             self.costs_tup = self.values["Project (cost/worth)"][0]
@@ -543,24 +626,37 @@ class OptimalProject(OutlineCalculation):
 
     def calculate(self):
         super().calculate()
-        prob = LpProblem("Maximize_Value", LpMaximize)
-        n = len(self.costs_tup)
-        x = [LpVariable(f"x{i}", cat = "Binary") for i in range(n)]
-        prob += lpSum(self.worth_tup[i] * x[i] for i in range(n)), "Total_Value"
-        prob += lpSum(self.costs_tup[i] * x[i] for i in range(n)) <= self.max, "Budget_Constraint"
-        prob.solve()
-        selected_projects = [i + 1 for i in range(n) if x[i].varValue == 1]
+        if len(self.costs_tup) > self.native_project_limit:
+            selected_projects = self.solve_with_pulp()
+        else:
+            try:
+                selected, _ = solver_calc.optimal_projects(self.costs_tup, self.worth_tup,
+                                                           self.max)[0]
+                selected_projects = [int(i) + 1 for i in selected]
+            except (RuntimeError, MemoryError):  # the search gave up; let PuLP's MILP solve it
+                selected_projects = self.solve_with_pulp()
         print(selected_projects)
         total_value = sum(self.worth_tup[i - 1] for i in selected_projects)
         return f"/ are {selected_projects} with a max value of {total_value}"
 
+    def solve_with_pulp(self):
+        prob = pulp.LpProblem("Maximize_Value", pulp.LpMaximize)
+        n = len(self.costs_tup)
+        x = [pulp.LpVariable(f"x{i}", cat = "Binary") for i in range(n)]
+        prob += pulp.lpSum(self.worth_tup[i] * x[i] for i in range(n)), "Total_Value"
+        prob += pulp.lpSum(self.costs_tup[i] * x[i] for i in range(n)) <= self.max, "Budget_Constraint"
+        prob.solve()
+        return [i + 1 for i in range(n) if x[i].varValue == 1]
+
 
 class OptimizeParBonds(OutlineCalculation):
+    requirements = ["Obligations List", "Periods", "Bond Yield List", "Face Value"]
+    persist_results = True
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Optimize Par-Bonds"
         self.title = "Optimize Par-Bonds against Obligations"
-        self.requirements = ["Obligations List", "Periods", "Bond Yield List", "Face Value"]
         self.valid = self.validate_values()
         if self.valid:
             self.obl_list = self.values["Obligations List"]
@@ -570,28 +666,17 @@ class OptimizeParBonds(OutlineCalculation):
 
     def calculate(self):
         super().calculate()
-        c = np.full(self.periods, self.fv)
-        A = np.zeros((self.periods, self.periods))
-        for i in range(self.periods):
-            for j in range(i, self.periods):
-                if i == j:
-                    A[i, j] = self.fv + self.bond_y_list[j] * self.fv  # redemption value + coupon payment
-                else:
-                    A[i, j] = self.bond_y_list[j] * self.fv # coupon payment
-        b = np.array(self.obl_list)
-        result = linprog(c, A_ub = -A, b_ub = -b, method = "highs")
-        answer = []
-        for i, x in enumerate(result.x, 1):
-            answer.append(f"Bond {i} ({self.bond_y_list[i - 1]}% annual coupon): {x:.2f} units")
-        return '\n'.join(answer)
+        return solver_calc.optimize_par_bonds(self.bond_y_list, self.fv, self.periods,
+                                              self.obl_list)
 
 
 class ModifiedDurationShort(OutlineCalculation):
+    requirements = ["Change in Bond Price", "Change in Yield", "Bond Price"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Modified Duration Short"
         self.title = "Modified Duration based on Change of Price and Yields aka Sensitivity"
-        self.requirements = ["Change in Bond Price", "Change in Yield", "Bond Price"]
         self.valid = self.validate_values()
         if self.valid:
             self.change_bp = self.values["Change in Bond Price"]
@@ -604,11 +689,12 @@ class ModifiedDurationShort(OutlineCalculation):
 
 
 class NewBondPriceShort(OutlineCalculation):
+    requirements = ["Modified Duration", "Change in Yield", "Bond Price"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Modified Duration Short"
         self.title = "Modified Duration based on Change of Price and Yields aka Sensitivity"
-        self.requirements = ["Modified Duration", "Change in Yield", "Bond Price"]
         self.valid = self.validate_values()
         if self.valid:
             self.D_m = self.values["Modified Duration"]
@@ -622,11 +708,12 @@ class NewBondPriceShort(OutlineCalculation):
 
 
 class NewYieldShort(OutlineCalculation):
+    requirements = ["Modified Duration", "Change in Bond Price", "Bond Price", "Yield"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "New Yield"
         self.title = "New Yield"
-        self.requirements = ["Modified Duration", "Change in Bond Price", "Bond Price", "Yield"]
         self.valid = self.validate_values()
         if self.valid:
             self.D_m = self.values["Modified Duration"]
@@ -640,12 +727,14 @@ class NewYieldShort(OutlineCalculation):
 
 
 class OptimizeBondsForObligations(OutlineCalculation):
+    requirements = ["Coupon List", "Face Value List", "Periods List", "Obligation List",
+                    "Bond Price List"]
+    persist_results = True
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Optimize Bonds For Obligations"
         self.title = "Optimal Bonds For Obligations"
-        self.requirements = ["Coupon List", "Face Value List", "Periods List", "Obligation List",
-                             "Bond Price List"]
         self.valid = self.validate_values()
         if self.valid:
             self.coup_list = self.values["Coupon List"]
@@ -656,42 +745,33 @@ class OptimizeBondsForObligations(OutlineCalculation):
 
     def calculate(self):
         super().calculate()
-        num_bonds = len(self.bp_list)
-        equations = []
-        for year in range(1, len(self.obl_list) + 1):
-            year_values = []
-            for i in range(num_bonds):
-                if year == self.period_list[i]:
-                    bond_value = self.fv_list[i] + self.coup_list[i]
-                elif year < self.period_list[i]:
-                    bond_value = self.coup_list[i]
-                else:
-                    bond_value = 0
-                year_values.append(bond_value)
-            equations.append(year_values)
-        prob = LpProblem("Matching Equations and Obligations", LpMinimize)
-        variables = [LpVariable(f"Bond {i + 1}", lowBound = 0) for i in range(num_bonds)]
-        for i, equation in enumerate(equations):
-            prob += lpSum(variables[j] * equation[j] for j in range(num_bonds)) >= self.obl_list[i]
-        prob += lpSum(variables[i] * data["Bond Price List"][i] for i in range(num_bonds))
-        prob.solve()
-        result_string = "\n".join([f"{var.name} = {value(var)}" for i, var in enumerate(variables)])
-        return ":" + "\n" + result_string
+        return solver_calc.match_obligations(self.coup_list, self.fv_list, self.period_list,
+                                             self.bp_list, self.obl_list)
 
 class PaymentLoanVariedRates(OutlineCalculation):
+    requirements = ["Spot Rate List", "Periods", "Principal"]
+    optional_requirements = ["Discount Curve"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Payments for Loan"
         self.title = "Payments Needed For Loan"
-        self.requirements = ["Spot Rate List", "Periods", "Principal"]
         self.valid = self.validate_values()
         if self.valid:
             self.p = self.values["Principal"]
             self.y_lst = self.values["Spot Rate List"]
             self.periods = self.values["Periods"]
+            self.curve = self.values.get("Discount Curve", None)
 
     def calculate(self):
         super().calculate()
+        if self.curve is not None:
+            # The Spot Rate List here holds one-year rates in percent; a spot-rate curve would
+            # read the same numbers differently, so only a matching curve is accepted
+            if self.curve.rate_convention != "yearly":
+                raise ValueError("Payment Loan Varied Rates needs a curve built with "
+                                 "DiscountCurve.from_yearly_rates(Spot Rate List, percent=True)")
+            return self.p / self.curve.period_factors(self.periods).sum()
         spot_rate = [x/100 + 1 for x in self.y_lst]
         interest_per_year = [spot_rate[0]]
         interest = spot_rate[0]
@@ -725,6 +805,8 @@ determ_key = {
     "Optimal Project": OptimalProject,
     "Optimize Par-Bonds": OptimizeParBonds,
     "Immunize Portfolio": ImmunizePortfolio,
+    "Immunize Portfolio Bonds": ImmunizePortfolioBonds,
+    "Key Rate Durations": KeyRateDurations,
     "Modified Duration Short": ModifiedDurationShort,
     "New Bond Price Short": NewBondPriceShort,
     "New Yield Short": NewYieldShort,
@@ -735,7 +817,6 @@ determ_key = {
 # error in 34:40 lec 6
 # be able to enter a list of spot rates to find expected for next year (f1,2  f1,3  f1,4 )
 # how to do payments given difference interest
-# change in price, change for all relevant possibilities
 # check normal duration calculation
 # create coupon %
 # allow it to be added with face value after assumption of FV 100
@@ -0,0 +1,157 @@
+# Opt-in timing and counters for calculations. Every calculate() goes through traced(), which
+# is a single global check until enable_instrumentation() installs a Recorder.
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+OUTSIDE = "(outside calculations)"
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "thread", "start", "end", "counters")
+
+    def __init__(self, span_id, parent, name, thread, start):
+        self.id = span_id
+        self.parent = parent  # id of the enclosing span, or None at the top level
+        self.name = name
+        self.thread = thread
+        self.start = start
+        self.end = None
+        self.counters = {}
+
+    def to_dict(self, origin):
+        return {"id": self.id, "parent": self.parent, "name": self.name, "thread": self.thread,
+                "start_us": (self.start - origin) / 1000,
+                "duration_us": (self.end - self.start) / 1000, "counters": self.counters}
+
+
+class Recorder:
+    # Keeps finished spans (up to max_spans, after which only the totals grow) and per class
+    # totals of calls, wall time, time spent outside child spans and any counters
+    def __init__(self, max_spans=1_000_000):
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped_spans = 0
+        self.totals = defaultdict(lambda: defaultdict(int))
+        self.origin = time.perf_counter_ns()
+        self.next_id = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def start(self, name):
+        stack = self.stack()
+        with self.lock:
+            span_id = self.next_id
+            self.next_id += 1
+        span = Span(span_id, stack[-1].id if stack else None, name, threading.get_ident(),
+                    time.perf_counter_ns())
+        span.counters["child_ns"] = 0
+        stack.append(span)
+        return span
+
+    def finish(self, span):
+        span.end = time.perf_counter_ns()
+        stack = self.stack()
+        stack.pop()
+        elapsed = span.end - span.start
+        child_ns = span.counters.pop("child_ns")
+        if stack:
+            stack[-1].counters["child_ns"] += elapsed
+        with self.lock:
+            totals = self.totals[span.name]
+            totals["calls"] += 1
+            totals["wall_s"] += elapsed / 1e9
+            totals["self_s"] += (elapsed - child_ns) / 1e9
+            for name, amount in span.counters.items():
+                totals[name] += amount
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def count(self, name, amount=1, owner=None):
+        # Adds to the innermost open span, or with none open straight to owner's (or OUTSIDE's)
+        # totals
+        stack = self.stack()
+        if stack:
+            counters = stack[-1].counters
+            counters[name] = counters.get(name, 0) + amount
+            return
+        with self.lock:
+            self.totals[owner or OUTSIDE][name] += amount
+
+    def summary(self):
+        return {name: dict(totals) for name, totals in sorted(
+            self.totals.items(), key=lambda item: -item[1].get("wall_s", 0))}
+
+    def report(self):
+        return {"pid": os.getpid(), "summary": self.summary(), "dropped_spans": self.dropped_spans,
+                "spans": [span.to_dict(self.origin) for span in self.spans]}
+
+    def chrome_trace(self):
+        # Complete ("X") events for chrome://tracing or Perfetto, timestamps in microseconds
+        pid = os.getpid()
+        events = [{"name": span.name, "cat": "calculation", "ph": "X", "pid": pid,
+                   "tid": span.thread, "ts": (span.start - self.origin) / 1000,
+                   "dur": (span.end - span.start) / 1000, "args": span.counters}
+                  for span in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f)
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def clear(self):
+        self.__init__(self.max_spans)
+
+
+recorder = None  # opt in with enable_instrumentation()
+
+
+def enable_instrumentation(max_spans=1_000_000):
+    global recorder
+    recorder = Recorder(max_spans)
+    return recorder
+
+
+def disable_instrumentation():
+    global recorder
+    finished, recorder = recorder, None
+    return finished
+
+
+def count(name, amount=1, owner=None):
+    # Counter hook for solvers and copies; does nothing while instrumentation is off
+    if recorder is not None:
+        recorder.count(name, amount, owner)
+
+
+def traced(cls, calculate):
+    # Wraps a calculation class's own calculate() in a span named after the class. A subclass
+    # that calls super().calculate() is recorded once, under its own name.
+    name = cls.__name__
+
+    @functools.wraps(calculate)
+    def wrapper(self, *args, **kwargs):
+        if recorder is None or type(self).calculate is not wrapper:
+            return calculate(self, *args, **kwargs)
+        active = recorder
+        span = active.start(name)
+        try:
+            return calculate(self, *args, **kwargs)
+        finally:
+            active.finish(span)
+
+    return wrapper
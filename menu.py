@@ -1,9 +1,10 @@
-from calc_manager import menu_layout, OutlineCalculation
+from calc_manager import menu_layout, OutlineCalculation, RequirementIndex
 from deterministic_calc import determ_key
 
 
 calculation_key = {}
 calculation_key.update(determ_key)
+requirement_index = RequirementIndex(calculation_key)
 
 
 def format_val(value):
@@ -80,10 +81,7 @@ def enter_value(value_dict) -> (None, str):
 def complete_calculation_entry(value_dict) -> (None, str):
     print('\n' * 40)
     more_info = False
-    valid_calculations = []
-    for key, calc in calculation_key.items():
-        if calc(value_dict).valid:
-            valid_calculations.append(key)
+    valid_calculations = requirement_index.runnable(value_dict)
     if valid_calculations:
         i = 1
         print('Based on Information, I can Calculate the following:')
@@ -97,20 +95,7 @@ def complete_calculation_entry(value_dict) -> (None, str):
         else:
             more_info = True
     if more_info == True or not valid_calculations:
-        closest_calculations = []
-        max_similarity = -1
-        for key, calc in calculation_key.items():
-            calc_obj = calc(value_dict)
-            info_needed = len(calc_obj.requirements)
-            missing = len(calc_obj.missing_values)
-            similarity = (info_needed - missing) / info_needed
-            if similarity >= 1:
-                similarity = 0
-            if similarity > max_similarity:
-                max_similarity = similarity
-                closest_calculations = [(key, calc_obj.missing_values)]
-            elif similarity == max_similarity:
-                closest_calculations.append((key, calc_obj.missing_values))
+        closest_calculations = requirement_index.closest(value_dict)
         print('\nCannot Calculate, Information is Missing')
         print("\nHere are my suggestion(s):")
         for key, items in closest_calculations:
@@ -122,22 +107,15 @@ def complete_calculation_entry(value_dict) -> (None, str):
         if x.strip() == "0" and valid_calculations:
             print('\n' * 40)
             print(f"\nHere are more Suggestions:")
-            for key, calc in calculation_key.items():
-                calc_obj = calc(value_dict)
-                info_needed = len(calc_obj.requirements)
-                missing = len(calc_obj.missing_values)
-                similarity = (info_needed - missing) / info_needed
-                if similarity > 0:
-                    key_str = f"Key: {key}"
-                    print(f'{key_str:<30} | Missing: {calc_obj.missing_values}')
+            for key, items in requirement_index.suggestions(value_dict):
+                key_str = f"Key: {key}"
+                print(f'{key_str:<30} | Missing: {items}')
             x = input("\nPress Enter to Continue or \"0\" for ALL options: ")
             if x.strip() == "0":
                 print('\n' * 40)
-                for key, calc in calculation_key.items():
-                    calc_obj = calc(value_dict)
-                    key_str = f"Key: {key}"
+                for key, items in requirement_index.suggestions(value_dict, -1):
                     key_str = f"Key: {key}"
-                    print(f'{key_str:<30} | Missing: {calc_obj.missing_values}')
+                    print(f'{key_str:<30} | Missing: {items}')
                 x = input("\nPress Enter to Continue: ")
         elif x.strip().upper() == "CLEAR":
             value_dict.clear()
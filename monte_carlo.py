@@ -0,0 +1,106 @@
+# Monte Carlo distribution of single-period returns: draws Amount Received (and optionally
+# Amount Invested) and runs TotalReturn / RateOfReturn on whole chunks of draws at once
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from single_period_random_calc import RateOfReturn, TotalReturn
+
+# name -> draw(rng, size, *params)
+distributions = {
+    "normal": lambda rng, size, mean, std: rng.normal(mean, std, size),
+    "lognormal": lambda rng, size, mean, sigma: rng.lognormal(mean, sigma, size),  # of the log
+    "uniform": lambda rng, size, low, high: rng.uniform(low, high, size),
+    "t": lambda rng, size, df, loc, scale: loc + scale * rng.standard_t(df, size),
+    "empirical": lambda rng, size, values: rng.choice(np.asarray(values, dtype=float), size),
+}
+
+QUANTILE_GRID = np.linspace(0, 1, 10_001)  # each chunk's quantiles are kept at this resolution
+
+
+def draw(spec, rng, size):
+    # spec is a fixed number, a (distribution name, *params) tuple or a draw(rng, size) callable
+    if callable(spec):
+        return np.asarray(spec(rng, size), dtype=float)
+    if isinstance(spec, (tuple, list)):
+        name, *params = spec
+        if name not in distributions:
+            raise ValueError(f"Unknown distribution {name!r}")
+        return distributions[name](rng, size, *params)
+    return np.full(size, float(spec))
+
+
+def chunk_summary(values):
+    return {"count": values.size, "mean": values.mean(),
+            "m2": np.square(values - values.mean()).sum(),
+            "quantiles": np.quantile(values, QUANTILE_GRID)}
+
+
+def simulate_chunk(seed, size, received, invested):
+    # One chunk on its own generator; seed is a SeedSequence child, so the draws depend only
+    # on the chunk's position and never on which worker ran it
+    rng = np.random.Generator(np.random.PCG64(seed))
+    values = {"Amount Received": draw(received, rng, size),
+              "Amount Invested": draw(invested, rng, size)}
+    return {"total_return": chunk_summary(TotalReturn(values).calculate()),
+            "rate_of_return": chunk_summary(RateOfReturn(values).calculate())}
+
+
+def merge_summaries(summaries, quantiles, confidence, breakeven=0.0):
+    counts = np.array([s["count"] for s in summaries], dtype=float)
+    means = np.array([s["mean"] for s in summaries])
+    total = counts.sum()
+    mean = (counts * means).sum() / total
+    # Chan et al. pairwise update, done for all chunks at once
+    m2 = sum(s["m2"] for s in summaries) + (counts * np.square(means - mean)).sum()
+
+    # Pooled CDF of the chunks (each interpolated from its quantile grid), inverted on a grid
+    grids = np.array([s["quantiles"] for s in summaries])
+    points = np.unique(grids)
+    if points.size > 200_000:
+        points = points[np.linspace(0, points.size - 1, 200_000).astype(int)]
+    cdf = sum(weight * np.interp(points, grid, QUANTILE_GRID)
+              for weight, grid in zip(counts / total, grids))
+
+    def quantile(p):
+        return np.interp(p, cdf, points)
+
+    result = {"samples": int(total), "mean": mean, "variance": m2 / max(total - 1, 1),
+              "std": np.sqrt(m2 / max(total - 1, 1)), "min": grids[:, 0].min(),
+              "max": grids[:, -1].max(),
+              "quantiles": {p: float(quantile(p)) for p in quantiles},
+              "var": {}, "expected_shortfall": {}}
+    for level in confidence:
+        tail = np.linspace(0, 1 - level, 1001)
+        # Losses are positive fractions of the amount invested, measured from breakeven
+        result["var"][level] = breakeven - float(quantile(1 - level))
+        result["expected_shortfall"][level] = breakeven - float(quantile(tail).mean())
+    return result
+
+
+def simulate_returns(received, invested, samples=1_000_000, seed=None, chunk_size=1_000_000,
+                     workers=0, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99),
+                     confidence=(0.95, 0.99)):
+    # Mean, variance, quantiles, VaR and expected shortfall of TotalReturn and RateOfReturn;
+    # VaR is the same loss for both since total return breaks even at 1. The same seed and
+    # chunk_size give the same answer for any number of workers (0 runs in this process).
+    sizes = [chunk_size] * (samples // chunk_size)
+    if samples % chunk_size:
+        sizes.append(samples % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(child, size, received, invested) for child, size in zip(seeds, sizes)]
+    if workers:
+        for name, spec in (("received", received), ("invested", invested)):
+            try:  # fail here, not deep inside the pool
+                pickle.dumps(spec)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                raise ValueError(f"With workers the {name} spec must be picklable (a named "
+                                 f"distribution or a module-level function), not a lambda "
+                                 f"or closure: {e}") from e
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(simulate_chunk, *zip(*jobs)))
+    else:
+        chunks = [simulate_chunk(*job) for job in jobs]
+    return {name: merge_summaries([chunk[name] for chunk in chunks], quantiles, confidence,
+                                  breakeven)
+            for name, breakeven in (("total_return", 1.0), ("rate_of_return", 0.0))}
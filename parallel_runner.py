@@ -0,0 +1,104 @@
+# Fans (calculation name, values) jobs out over a process pool
+import contextlib
+import itertools
+import os
+import signal
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from batch_runner import evaluate_row
+from calc_manager import enable_result_cache
+from result_store import enable_result_store
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    # Per-job timeout inside a worker; needs SIGALRM, so it is skipped where that is missing
+    if not seconds or not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise TimeoutError(f"Job took longer than {seconds} seconds")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def start_worker(cache_size, store_dir):
+    if cache_size:
+        enable_result_cache(cache_size)
+    if store_dir:
+        enable_result_store(store_dir)
+
+
+def evaluate_chunk(chunk, timeout=None):
+    results = []
+    for row, record in chunk:
+        try:
+            with time_limit(timeout):
+                results.append(evaluate_row(row, record))
+        except TimeoutError as e:  # the alarm went off between evaluate_row and clearing it
+            results.append({"row": row, "calculation": record.get("Calculation")
+                            if isinstance(record, dict) else None,
+                            "error": f"TimeoutError: {e}"})
+    return results
+
+
+def chunked(rows, chunksize):
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, chunksize)):
+        yield chunk
+
+
+def run_records_parallel(records, workers=None, chunksize=1, ordered=True, timeout=None,
+                         first_row=1, cache_size=0, store_dir=None):
+    # Yields one evaluate_row result per record. Only a few chunks per worker are in flight at
+    # a time, so records can be a stream of any length.
+    workers = workers or os.cpu_count() or 1
+    chunks = enumerate(chunked(enumerate(records, first_row), chunksize))
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=start_worker,
+                             initargs=(cache_size, store_dir)) as pool:
+        pending = {}
+        finished = {}
+        next_chunk = 0
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    index, chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(evaluate_chunk, chunk, timeout)] = (index, chunk)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, chunk = pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:  # the worker died, e.g. BrokenProcessPool
+                    results = [{"row": row, "calculation": record.get("Calculation")
+                                if isinstance(record, dict) else None,
+                                "error": f"{type(e).__name__}: {e}"} for row, record in chunk]
+                if ordered:
+                    finished[index] = results
+                else:
+                    yield from results
+            while next_chunk in finished:
+                yield from finished.pop(next_chunk)
+                next_chunk += 1
+
+
+def run_parallel(jobs, workers=None, chunksize=1, ordered=True, timeout=None, cache_size=0,
+                 store_dir=None):
+    # jobs are (calculation name, values) pairs; each result's row is the job's position in jobs
+    records = ({**values, "Calculation": name} for name, values in jobs)
+    return run_records_parallel(records, workers, chunksize, ordered, timeout, first_row=0,
+                                cache_size=cache_size, store_dir=store_dir)
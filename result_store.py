@@ -0,0 +1,133 @@
+# Persistent on-disk results for the expensive solver calculations, shared across processes
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+
+from calc_manager import calculation_key_hash
+
+SOURCE_FILES = ["calc_manager.py", "deterministic_calc.py", "batch_calc.py", "solver_calc.py"]
+
+
+def code_version():
+    # Any change to the calculation code starts a fresh set of keys
+    digest = hashlib.sha256()
+    for name in SOURCE_FILES:
+        digest.update((Path(__file__).resolve().parent / name).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def default_directory():
+    return Path(os.environ.get("FINCALC_CACHE_DIR") or Path.home() / ".cache" / "fincalc")
+
+
+class ResultStore:
+    # SQLite file of pickled results keyed on calculation_key_hash plus the code version.
+    # Least recently used rows are evicted once the stored results pass max_bytes.
+    def __init__(self, directory=None, max_bytes=256 * 1024 ** 2, version=None):
+        self.directory = Path(directory) if directory else default_directory()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "results.sqlite3"
+        self.max_bytes = max_bytes
+        self.version = version or code_version()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                                "value BLOB NOT NULL, size INTEGER NOT NULL, "
+                                "last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used "
+                                "ON results (last_used)")
+        # Running byte total, kept by triggers in the statement that changes results, so no
+        # insert has to sum the whole table
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, "
+                                "value INTEGER NOT NULL)")
+        self.connection.execute("INSERT OR IGNORE INTO meta SELECT 'bytes', "
+                                "COALESCE(SUM(size), 0) FROM results")
+        for name, event, change in (("insert", "INSERT", "new.size"),
+                                    ("delete", "DELETE", "-old.size"),
+                                    ("update", "UPDATE OF size", "new.size - old.size")):
+            self.connection.execute(f"CREATE TRIGGER IF NOT EXISTS results_bytes_{name} "
+                                    f"AFTER {event} ON results BEGIN UPDATE meta SET "
+                                    f"value = value + {change} WHERE name = 'bytes'; END")
+        self.connection.execute("COMMIT")
+
+    def get(self, key):
+        # Returns (found, value)
+        row = self.connection.execute("SELECT value FROM results WHERE key = ?",
+                                      (key,)).fetchone()
+        if row is None:
+            return False, None
+        self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?",
+                                (time.time(), key))
+        return True, pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        # An upsert, not INSERT OR REPLACE, so the byte total triggers see the replaced row
+        self.connection.execute("INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) "
+                                "DO UPDATE SET value = excluded.value, size = excluded.size, "
+                                "last_used = excluded.last_used",
+                                (key, blob, len(blob), time.time()))
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def size(self):
+        return self.connection.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def evict(self):
+        excess = self.size() - self.max_bytes
+        while excess > 0:
+            oldest = self.connection.execute("SELECT key, size FROM results "
+                                             "ORDER BY last_used LIMIT 64").fetchall()
+            if not oldest:
+                return
+            dropped = []
+            for key, size in oldest:
+                dropped.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.connection.executemany("DELETE FROM results WHERE key = ?", dropped)
+
+    def calculate(self, name, calc, use_cache=True):
+        if not use_cache or not calc.valid:
+            return calc.calculate()
+        try:
+            key = calculation_key_hash(name, calc, self.version)
+        except TypeError:
+            return calc.calculate()
+        found, result = self.get(key)
+        if found:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = calc.calculate()
+        self.put(key, result)
+        return result
+
+    def clear(self):
+        self.connection.execute("DELETE FROM results")
+
+    def info(self):
+        rows = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "rows": rows, "bytes": self.size(),
+                "max_bytes": self.max_bytes, "path": str(self.path)}
+
+
+result_store = None  # opt in with enable_result_store()
+
+
+def enable_result_store(directory=None, max_bytes=256 * 1024 ** 2):
+    global result_store
+    result_store = ResultStore(directory, max_bytes)
+    return result_store
+
+
+def disable_result_store():
+    global result_store
+    result_store = None
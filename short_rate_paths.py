@@ -0,0 +1,165 @@
+# Short-rate path simulation (Vasicek, CIR, Hull-White) and path-wise valuation. Paths come
+# in blocks of (paths x steps + 1) rates with their discount factors, and are priced block by
+# block, so memory depends on block_paths and not on the number of paths.
+import math
+
+import numpy as np
+from batch_calc import DiscountCurve, pad_cashflows
+
+
+class Vasicek:
+    # dr = speed * (mean - r) dt + sigma dW, stepped with its exact Gaussian transition
+    def __init__(self, r0, speed, mean, sigma):
+        self.r0 = r0
+        self.speed = speed
+        self.mean = mean
+        self.sigma = sigma
+
+    def transition(self, dt):
+        decay = math.exp(-self.speed * dt)
+        if self.speed == 0:
+            return decay, self.sigma * math.sqrt(dt)
+        return decay, self.sigma * math.sqrt((1 - decay ** 2) / (2 * self.speed))
+
+    def simulate(self, rng, paths, steps, dt):
+        decay, scale = self.transition(dt)
+        rates = np.empty((paths, steps + 1))
+        rates[:, 0] = self.r0
+        for k in range(steps):
+            rates[:, k + 1] = rates[:, k] * decay + self.mean * (1 - decay) \
+                + scale * rng.standard_normal(paths)
+        return rates
+
+
+class CIR:
+    # dr = speed * (mean - r) dt + sigma sqrt(r) dW, stepped with its exact scaled
+    # noncentral chi-square transition, so rates never go negative
+    def __init__(self, r0, speed, mean, sigma):
+        self.r0 = r0
+        self.speed = speed
+        self.mean = mean
+        self.sigma = sigma
+
+    def simulate(self, rng, paths, steps, dt):
+        decay = math.exp(-self.speed * dt)
+        scale = self.sigma ** 2 * (1 - decay) / (4 * self.speed)
+        df = 4 * self.speed * self.mean / self.sigma ** 2
+        rates = np.empty((paths, steps + 1))
+        rates[:, 0] = self.r0
+        for k in range(steps):
+            rates[:, k + 1] = scale * rng.noncentral_chisquare(df, rates[:, k] * decay / scale)
+        return rates
+
+
+class HullWhite:
+    # dr = (theta(t) - speed * r) dt + sigma dW with theta fitted to a Spot Rate List, so the
+    # expected discount factors reprice that curve. Simulated as r = alpha(t) + x with x an
+    # exact Vasicek process around zero.
+    def __init__(self, speed, sigma, spot_rates=None, compound="Annual", custom=None,
+                 curve=None):
+        self.speed = speed
+        self.sigma = sigma
+        self.curve = curve or DiscountCurve(spot_rates, compound, custom)
+        self.deviation = Vasicek(0.0, speed, 0.0, sigma)
+
+    def forward(self, times, h=1e-5):
+        # Instantaneous forward rates from the curve's log discount factors
+        times = np.asarray(times, dtype=float)
+        lower = np.maximum(times - h, 0.0)
+        log_factors = np.log(self.curve.compute_terms(np.stack([lower, times + h]))[0])
+        return -(log_factors[1] - log_factors[0]) / (times + h - lower)
+
+    def alpha(self, times):
+        if self.speed == 0:
+            return self.forward(times) + self.sigma ** 2 * times ** 2 / 2
+        return self.forward(times) \
+            + (self.sigma / self.speed) ** 2 / 2 * (1 - np.exp(-self.speed * times)) ** 2
+
+    @property
+    def r0(self):
+        return float(self.forward(np.zeros(1))[0])
+
+    def simulate(self, rng, paths, steps, dt):
+        return self.deviation.simulate(rng, paths, steps, dt) \
+            + self.alpha(np.arange(steps + 1) * dt)
+
+
+def path_discounts(rates, dt):
+    # Discount factor to every grid time on every path, integrating the rate by trapezoids
+    discounts = np.empty(rates.shape)
+    discounts[:, 0] = 0.0  # log of the factor at time 0
+    np.cumsum((rates[:, :-1] + rates[:, 1:]) * (-dt / 2), axis=1, out=discounts[:, 1:])
+    return np.exp(discounts, out=discounts)
+
+
+def rate_blocks(model, paths, steps, dt, seed=None, block_paths=10_000):
+    # Yields (rates, discounts) per block of paths, both (block x steps + 1) over times
+    # 0, dt, ..., steps * dt. Each block has its own SeedSequence child, so a seed gives the
+    # same paths for a given block_paths.
+    firsts = range(0, paths, block_paths)
+    for first, child in zip(firsts, np.random.SeedSequence(seed).spawn(len(firsts))):
+        rng = np.random.Generator(np.random.PCG64(child))
+        rates = model.simulate(rng, min(block_paths, paths - first), steps, dt)
+        yield rates, path_discounts(rates, dt)
+
+
+def factors_at(discounts, dt, times):
+    # (paths x times) discount factors, log-linear between grid times
+    position = np.asarray(times, dtype=float) / dt
+    if position.size and (position.min() < 0 or position.max() > discounts.shape[1] - 1 + 1e-9):
+        raise ValueError(f"Paths only reach {(discounts.shape[1] - 1) * dt} years")
+    low = np.minimum(np.floor(position + 1e-9).astype(int), discounts.shape[1] - 1)
+    high = np.minimum(low + 1, discounts.shape[1] - 1)
+    weight = np.clip(position - low, 0.0, 1.0)
+    return discounts[:, low] ** (1 - weight) * discounts[:, high] ** weight
+
+
+def bond_cashflow_schedule(face_values, coupons, coupons_per_period, periods):
+    # (times, cashflows) with cashflows (bonds x times): coupons / m paid every 1 / m years
+    # and the face value at maturity, matching BondPrice
+    face_values, coupons, m, periods = (np.atleast_1d(a) for a in np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (face_values, coupons, coupons_per_period,
+                                              periods))))
+    counts = np.rint(m * periods).astype(int)
+    bonds = np.repeat(np.arange(counts.size), counts)
+    payment = np.arange(bonds.size) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    times, column = np.unique(np.round(payment / m[bonds], 12), return_inverse=True)
+    cash = (coupons / m)[bonds] + np.where(payment == counts[bonds], face_values[bonds], 0.0)
+    cashflows = np.zeros((counts.size, times.size))
+    np.add.at(cashflows, (bonds, column), cash)
+    return times, cashflows
+
+
+def cashflow_stream_schedule(cashflows, start_year=0.0):
+    # (times, cashflows) for CashflowValue-style streams: entry k is paid at start_year + k
+    cf = np.asarray(cashflows, dtype=float) if isinstance(cashflows, np.ndarray) \
+        else pad_cashflows(cashflows)
+    cf = np.atleast_2d(cf)
+    return float(start_year) + np.arange(cf.shape[1]), cf
+
+
+def present_values_on_paths(discounts, dt, times, cashflows):
+    # (paths x instruments) value of every cashflow row on every path
+    return factors_at(discounts, dt, times) @ cashflows.T
+
+
+def loan_payments_on_paths(discounts, dt, principals, periods):
+    # (paths x loans) level yearly payment of PaymentLoanVariedRates on every path
+    principals, periods = (np.atleast_1d(a) for a in np.broadcast_arrays(
+        np.asarray(principals, dtype=float), np.asarray(periods, dtype=float)))
+    years = np.arange(1, int(periods.max()) + 1)
+    annuity = factors_at(discounts, dt, years) @ (years[:, None] <= periods[None, :])
+    return principals / annuity
+
+
+def value_on_paths(model, pricer, paths, steps, dt, seed=None, block_paths=10_000):
+    # Monte Carlo mean and standard error of pricer(discounts, dt), which returns one row
+    # per path, accumulated block by block
+    total = squares = 0.0
+    for _, discounts in rate_blocks(model, paths, steps, dt, seed, block_paths):
+        values = pricer(discounts, dt)
+        total = total + values.sum(axis=0)
+        squares = squares + np.square(values).sum(axis=0)
+    mean = total / paths
+    variance = np.maximum(squares / paths - mean ** 2, 0.0) * paths / max(paths - 1, 1)
+    return mean, np.sqrt(variance / paths)
@@ -4,10 +4,11 @@ from calc_manager import OutlineCalculation, compounding_methods, format_numeric
 
 
 class TotalReturn(OutlineCalculation):
+    requirements = ["Amount Received", "Amount Invested"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Total Return"  # include title
-        self.requirements = ["Amount Received", "Amount Invested"]
         self.valid = self.validate_values()
         if self.valid:
             self.AR = self.values["Amount Received"]
@@ -19,10 +20,11 @@ class TotalReturn(OutlineCalculation):
 
 
 class RateOfReturn(OutlineCalculation):
+    requirements = ["Amount Received", "Amount Invested"]
+
     def __init__(self, values: dict):
         super().__init__(values)
         self.calc = "Total Return"  # include title
-        self.requirements = ["Amount Received", "Amount Invested"]
         self.valid = self.validate_values()
         if self.valid:
             self.AR = self.values["Amount Received"]
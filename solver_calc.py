@@ -0,0 +1,297 @@
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+import instrumentation
+from batch_calc import DiscountCurve, bond_cashflow_matrix, bond_risk_measures, pad_cashflows
+
+try:
+    import highspy  # direct HiGHS bindings keep the last basis between re-solves
+except ImportError:
+    highspy = None
+
+
+def _cost_scale(costs, max_decimals=6):
+    # Smallest power of ten that makes every cost a whole number, None if there is none
+    for decimals in range(max_decimals + 1):
+        scaled = costs * 10 ** decimals
+        if np.allclose(scaled, np.round(scaled), rtol=0, atol=1e-9):
+            return 10 ** decimals
+    return None
+
+
+def _knapsack_table(costs, worths, capacity):
+    # 0/1 knapsack DP over every capacity up to capacity; keep[i, c] says item i is taken
+    # in the best packing of room c using items 0..i
+    best = np.zeros(capacity + 1)
+    keep = np.zeros((len(costs), capacity + 1), dtype=bool)
+    for i, (cost, worth) in enumerate(zip(costs, worths)):
+        if cost > capacity:
+            continue
+        candidate = best[:capacity + 1 - cost] + worth
+        better = candidate > best[cost:]
+        keep[i, cost:] = better
+        best[cost:] = np.where(better, candidate, best[cost:])
+    return keep
+
+
+def _knapsack_branch_and_bound(costs, worths, budget, max_nodes=1_000_000):
+    # Depth first over items sorted by worth per cost, pruned by the fractional (LP) bound.
+    # The search runs on an explicit stack, so any number of items fits; it gives up with
+    # RuntimeError after max_nodes nodes.
+    order = sorted(range(len(costs)), key=lambda i: worths[i] / costs[i], reverse=True)
+    best_value = 0.0
+    best_chosen = None
+
+    def bound(k, room, value):
+        for i in order[k:]:
+            if costs[i] <= room:
+                room -= costs[i]
+                value += worths[i]
+            else:
+                return value + worths[i] * room / costs[i]
+        return value
+
+    # Entries are (next position in order, room left, value, chosen) where chosen is a linked
+    # (item, rest) chain, so a branch never copies the items above it
+    stack = [(0, budget, 0.0, None)]
+    nodes = 0
+    while stack:
+        k, room, value, chosen = stack.pop()
+        nodes += 1
+        if nodes > max_nodes:
+            raise RuntimeError(f"Branch and bound gave up after {max_nodes} nodes")
+        if value > best_value:
+            best_value, best_chosen = value, chosen
+        if k == len(order) or bound(k, room, value) <= best_value + 1e-12:
+            continue
+        i = order[k]
+        stack.append((k + 1, room, value, chosen))
+        if costs[i] <= room:  # pushed last so taking the item is explored first
+            stack.append((k + 1, room - costs[i], value + worths[i], (i, chosen)))
+
+    best_items = []
+    while best_chosen is not None:
+        i, best_chosen = best_chosen
+        best_items.append(i)
+    return best_items[::-1]
+
+
+def optimal_projects(costs, worths, budgets, max_table_cells=50_000_000,
+                     max_search_nodes=1_000_000):
+    # Capital budgeting (0/1 knapsack) for one project list against any number of budgets.
+    # Returns [(selected project indices, total worth)] in the order of budgets. Uses an exact
+    # DP when the costs are whole numbers after decimal scaling, branch and bound otherwise;
+    # RuntimeError means the search passed max_search_nodes and another solver is needed.
+    costs = np.asarray(costs, dtype=float)
+    worths = np.asarray(worths, dtype=float)
+    budgets = np.atleast_1d(np.asarray(budgets, dtype=float))
+    if costs.shape != worths.shape or costs.ndim != 1:
+        raise ValueError("Every project needs exactly one cost and one worth")
+    if not (np.isfinite(costs).all() and np.isfinite(worths).all() and np.isfinite(budgets).all()):
+        raise ValueError("Project costs, worths and budgets must be finite")
+
+    # Free (or paying) projects that lose nothing are always done, costly worthless ones
+    # never. A paying project with negative worth starts out done and dropping it becomes the
+    # decision, so every remaining candidate has a positive cost and a positive worth.
+    always = np.flatnonzero((costs <= 0) & (worths >= 0) & ~((costs == 0) & (worths == 0)))
+    flipped = np.flatnonzero((costs < 0) & (worths < 0))
+    candidates = np.concatenate([np.flatnonzero((costs > 0) & (worths > 0)), flipped])
+    cand_costs = np.abs(costs[candidates])
+    cand_worths = np.abs(worths[candidates])
+    is_flipped = np.isin(candidates, flipped)
+    base_value = worths[always].sum() + worths[flipped].sum()
+    rooms = budgets - costs[always].sum() - costs[flipped].sum()
+    if (rooms < 0).any():  # even every paying project together cannot bring the spend down
+        raise ValueError(f"No selection of projects fits a budget of "
+                         f"{budgets[rooms < 0][0]:g}")
+
+    def selection(chosen):
+        chosen = np.asarray(chosen, dtype=int)
+        done = candidates[chosen][~is_flipped[chosen]]
+        dropped = candidates[chosen][is_flipped[chosen]]
+        selected = np.concatenate([always, done, np.setdiff1d(flipped, dropped)])
+        return np.sort(selected).astype(int), base_value + cand_worths[chosen].sum()
+
+    results = []
+    scale = _cost_scale(cand_costs)
+    capacity = int(np.floor(rooms.max(initial=0) * scale + 1e-9)) if scale else 0
+    if scale and len(candidates) * (capacity + 1) <= max_table_cells:
+        int_costs = np.round(cand_costs * scale).astype(int)
+        keep = _knapsack_table(int_costs, cand_worths, capacity)
+        for room in rooms:
+            left = int(np.floor(room * scale + 1e-9))
+            chosen = []
+            for i in range(len(candidates) - 1, -1, -1):
+                if keep[i, left]:
+                    chosen.append(i)
+                    left -= int_costs[i]
+            results.append(selection(chosen))
+    else:
+        for room in rooms:
+            results.append(selection(_knapsack_branch_and_bound(
+                cand_costs.tolist(), cand_worths.tolist(), room, max_search_nodes)))
+    return results
+
+
+def obligation_matching_matrix(coupons, face_values, maturities, horizon):
+    # Sparse (years x bonds) matrix of the cash every bond pays in years 1..horizon: the coupon
+    # each year up to maturity plus the face value in the maturity year
+    coupons = np.asarray(coupons, dtype=float)
+    face_values = np.asarray(face_values, dtype=float)
+    maturities = np.asarray(maturities, dtype=float)
+    years_paid = np.clip(np.floor(maturities), 0, horizon).astype(int)
+    bonds = np.repeat(np.arange(coupons.size), years_paid)
+    first_entry = np.repeat(np.cumsum(years_paid) - years_paid, years_paid)
+    years = np.arange(bonds.size) - first_entry + 1
+    cash = coupons[bonds] + np.where(years == maturities[bonds], face_values[bonds], 0.0)
+    return sparse.csr_array((cash, (years - 1, bonds)), shape=(horizon, coupons.size))
+
+
+def match_obligations(coupons, face_values, maturities, prices, obligations):
+    # Cheapest bond holdings whose yearly cash covers every obligation, solved with HiGHS
+    obligations = np.asarray(obligations, dtype=float)
+    coverage = obligation_matching_matrix(coupons, face_values, maturities, obligations.size)
+    result = linprog(np.asarray(prices, dtype=float), A_ub=-coverage, b_ub=-obligations,
+                     bounds=(0, None), method="highs")
+    instrumentation.count("solver_iterations", result.nit)
+    if result.status != 0:
+        raise ValueError(f"Obligations cannot be matched: {result.message}")
+    return result.x
+
+
+def par_bond_matrix(coupon_rates, face_value, periods):
+    # Sparse (years x bonds) cash of par bonds where bond j pays its coupon every year up to
+    # year j + 1 and its face value in that year, as in OptimizeParBonds
+    periods = int(periods)
+    coupon_rates = np.asarray(coupon_rates, dtype=float)[:periods]
+    years, bonds = np.triu_indices(periods)
+    cash = coupon_rates[bonds] * face_value + np.where(years == bonds, face_value, 0.0)
+    return sparse.csc_array((cash, (years, bonds)), shape=(periods, periods))
+
+
+par_bond_holdings = np.dtype([("bond", int), ("coupon_rate", float), ("units", float)])
+
+
+def optimize_par_bonds(coupon_rates, face_value, periods, obligations):
+    # Cheapest par-bond ladder covering the obligations, as a par_bond_holdings array
+    periods = int(periods)
+    coverage = par_bond_matrix(coupon_rates, face_value, periods)
+    result = linprog(np.full(periods, float(face_value)), A_ub=-coverage,
+                     b_ub=-np.asarray(obligations, dtype=float), bounds=(0, None),
+                     method="highs")
+    instrumentation.count("solver_iterations", result.nit)
+    if result.status != 0:
+        raise ValueError(f"Obligations cannot be matched: {result.message}")
+    holdings = np.zeros(periods, dtype=par_bond_holdings)
+    holdings["bond"] = np.arange(1, periods + 1)
+    holdings["coupon_rate"] = np.asarray(coupon_rates, dtype=float)[:periods]
+    holdings["units"] = result.x
+    return holdings
+
+
+class ObligationScenarios:
+    # Cash-flow matching model for a fixed bond universe, built once and re-solved for many
+    # obligation vectors. With highspy installed the HiGHS model stays loaded and every
+    # scenario starts from the previous optimal basis, otherwise each one goes through linprog.
+    def __init__(self, coverage, prices):
+        self.coverage = sparse.csc_array(coverage)
+        self.prices = np.asarray(prices, dtype=float)
+        self.horizon, self.num_bonds = self.coverage.shape
+        self.highs = self.load_highs() if highspy is not None else None
+
+    @classmethod
+    def for_bonds(cls, coupons, face_values, maturities, prices, horizon):
+        return cls(obligation_matching_matrix(coupons, face_values, maturities, horizon), prices)
+
+    @classmethod
+    def for_par_bonds(cls, coupon_rates, face_value, periods):
+        return cls(par_bond_matrix(coupon_rates, face_value, periods),
+                   np.full(int(periods), float(face_value)))
+
+    def load_highs(self):
+        lp = highspy.HighsLp()
+        lp.num_col_ = self.num_bonds
+        lp.num_row_ = self.horizon
+        lp.col_cost_ = self.prices
+        lp.col_lower_ = np.zeros(self.num_bonds)
+        lp.col_upper_ = np.full(self.num_bonds, highspy.kHighsInf)
+        lp.row_lower_ = np.zeros(self.horizon)
+        lp.row_upper_ = np.full(self.horizon, highspy.kHighsInf)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = self.coverage.indptr
+        lp.a_matrix_.index_ = self.coverage.indices
+        lp.a_matrix_.value_ = self.coverage.data
+        highs = highspy.Highs()
+        highs.setOptionValue("output_flag", False)
+        highs.passModel(lp)
+        return highs
+
+    def solve_one(self, obligations):
+        if self.highs is not None:
+            rows = np.arange(self.horizon, dtype=np.int32)
+            self.highs.changeRowsBounds(self.horizon, rows, obligations,
+                                        np.full(self.horizon, highspy.kHighsInf))
+            self.highs.run()
+            instrumentation.count("solver_iterations",
+                                  self.highs.getInfo().simplex_iteration_count)
+            if self.highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+                return None
+            return np.array(self.highs.getSolution().col_value)
+        result = linprog(self.prices, A_ub=-self.coverage, b_ub=-obligations, bounds=(0, None),
+                         method="highs")
+        instrumentation.count("solver_iterations", result.nit)
+        return result.x if result.status == 0 else None
+
+    def solve(self, obligations):
+        # obligations is (scenarios x years); shorter rows are padded with zero obligations.
+        # Returns (holdings, costs) with holdings (scenarios x bonds); an infeasible scenario
+        # gets nan holdings and cost.
+        if not isinstance(obligations, np.ndarray):
+            single = np.ndim(obligations[0]) == 0
+            obligations = pad_cashflows([obligations] if single else obligations)
+        obligations = np.atleast_2d(obligations).astype(float)
+        if obligations.shape[1] > self.horizon:
+            raise ValueError(f"Obligations run past the {self.horizon} year horizon")
+        padded = np.zeros((obligations.shape[0], self.horizon))
+        padded[:, :obligations.shape[1]] = obligations
+        holdings = np.full((padded.shape[0], self.num_bonds), np.nan)
+        for i, row in enumerate(padded):
+            x = self.solve_one(row)
+            if x is not None:
+                holdings[i] = x
+        return holdings, holdings @ self.prices
+
+
+def immunize_portfolio(spot_rates, face_values, coupons, periods, obligations, compound,
+                       custom=None, method="auto", curve=None):
+    # Units of each candidate bond whose present value and duration match the obligations.
+    # method: "solve" for exactly two bonds, "lstsq" for the minimum-norm match over any number
+    # of bonds, "lp" for the non-negative match with the most convexity; "auto" picks "solve"
+    # for two bonds and "lp" otherwise. A DiscountCurve passed as curve replaces the spot rates.
+    curve = curve or DiscountCurve(spot_rates, compound, custom)
+    horizon = curve.spot_rates.size
+    periods = np.asarray(periods, dtype=float)
+    obligations = np.asarray(obligations, dtype=float)
+    if periods.max() > horizon or obligations.size > horizon:
+        raise ValueError(f"Spot Rate List only covers {horizon} years")
+    assets = bond_cashflow_matrix(face_values, coupons, periods, horizon)
+    price, duration, convexity = bond_risk_measures(assets, curve)
+    liability = np.zeros(horizon)
+    liability[:obligations.size] = obligations
+    pv_ob, duration_ob, _ = bond_risk_measures(liability, curve)
+
+    A = np.vstack([price, price * duration])
+    B = np.array([pv_ob, pv_ob * duration_ob])
+    if method == "auto":
+        method = "solve" if price.size == 2 else "lp"
+    if method == "solve":
+        return np.linalg.solve(A, B)
+    if method == "lstsq":
+        return np.linalg.lstsq(A, B, rcond=None)[0]
+    if method == "lp":
+        result = linprog(-price * convexity, A_eq=A, b_eq=B, bounds=(0, None), method="highs")
+        instrumentation.count("solver_iterations", result.nit)
+        if result.status != 0:
+            raise ValueError(f"Obligations cannot be immunized: {result.message}")
+        return result.x
+    raise ValueError(f"Unknown immunization method {method!r}")